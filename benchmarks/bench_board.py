@@ -0,0 +1,208 @@
+"""
+Benchmarks for parsing boards and drawing them, run against the OpenLDBWS
+responses in benchmarks/fixtures. Those were recorded from src/standin.py: one
+stand-in synthesising seeded boards, and another in front of it with --record
+DIR --upstream, asked for each board through the normal loaders in trains.py.
+
+    python3 benchmarks/bench_board.py                       # print the timings
+    python3 benchmarks/bench_board.py --json run.json       # and save them
+    python3 benchmarks/bench_board.py --compare base.json   # and compare with an earlier run
+
+Each case reports the mean and best time per call, calls per second and the
+peak memory allocated during one call (from tracemalloc, measured separately
+so it doesn't slow the timings down). When comparing, any case whose mean has
+grown by more than --threshold percent is flagged and the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+FIXTURES = os.path.join(HERE, "fixtures")
+sys.path.insert(0, SRC)
+
+from luma.core.interface.serial import noop
+from luma.oled.device import ssd1322
+
+from config import loadConfig
+from display import DamageFramebuffer
+from fetcher import freezeBoard
+from glyphatlas import getAtlas
+from trains import ProcessDepartures, processDeparturesForDestination
+import main as board
+
+DEPARTURE_BOARDS = ("departures_small", "departures_large", "departures_split", "departures_bus", "departures_mixed")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name + ".xml"), encoding="utf-8") as f:
+        return f.read()
+
+
+def measure(run, minTime):
+    """ Call run() until minTime has passed, at least a few times, and return
+    (mean, best) seconds per call """
+    run()
+    times = []
+    started = time.perf_counter()
+    while len(times) < 5 or time.perf_counter() - started < minTime:
+        before = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - before)
+    return sum(times) / len(times), min(times)
+
+
+def peakAllocation(run):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def makeLayout(compositor):
+    board.useArrayCompositor = compositor == "numpy"
+    device = ssd1322(noop(), mode="1", rotate=2, framebuffer=DamageFramebuffer())
+    return board.BoardLayout(device, width=256, height=64)
+
+
+def cases(journey):
+    for name in DEPARTURE_BOARDS:
+        xml = fixture(name)
+        yield f"ProcessDepartures {name}", lambda xml=xml: ProcessDepartures(journey, xml)
+
+    arrivals = fixture("arrivals")
+    yield "ProcessDepartures arrivals", lambda: ProcessDepartures(
+        journey, arrivals, boardType="GetArrBoardWithDetailsResponse")
+
+    nextDepartures = fixture("next_departures")
+    yield "processDeparturesForDestination next_departures", lambda: processDeparturesForDestination(
+        journey, nextDepartures)
+
+    fault = fixture("fault")
+    yield "ProcessDepartures fault", lambda: ProcessDepartures(journey, fault)
+
+    departures, stationName = ProcessDepartures(journey, fixture("departures_large"))
+    data = (departures, departures[0].calling_at_list, stationName)
+    yield "freezeBoard departures_large", lambda: freezeBoard(data, 1)
+
+    snapshot = freezeBoard(data, 1)
+    platformNumber = departures[0].platform
+    yield "platform_filter departures_large", lambda: board.platform_filter(snapshot, platformNumber)
+
+    callingAt = departures[0].calling_at_list
+    board.cachedBitmapText(callingAt, board.font)
+    yield "cachedBitmapText hit", lambda: board.cachedBitmapText(callingAt, board.font)
+    yield "cachedBitmapText miss", lambda: getAtlas(board.font).render(callingAt)
+
+    compositors = ["pil"]
+    if board.numpyAvailable():
+        compositors.append("numpy")
+    for compositor in compositors:
+        def firstFrame(compositor=compositor):
+            layout = makeLayout(compositor)
+            layout.showBoard(board.platform_filter(snapshot, ""))
+            layout.refresh()
+        yield f"showBoard + refresh, first frame ({compositor})", firstFrame
+
+        layout = makeLayout(compositor)
+        layout.showBoard(board.platform_filter(snapshot, ""))
+        layout.refresh()
+        scroller = layout.screens["board"]["stations"][0]
+
+        def scrollFrame(layout=layout, scroller=scroller):
+            # move the calling points on a pixel rather than waiting for them
+            scroller.started -= 1 / scroller.speed
+            layout.refresh()
+        yield f"refresh, scrolling frame ({compositor})", scrollFrame
+
+        boards = [board.platform_filter(snapshot, ""),
+                  board.platform_filter(freezeBoard((departures[1:], departures[1].calling_at_list, stationName), 2), "")]
+
+        def newBoardFrame(layout=layout, boards=boards):
+            boards.reverse()
+            layout.showBoard(boards[0])
+            layout.refresh()
+        yield f"showBoard + refresh, new board ({compositor})", newBoardFrame
+
+
+def run(minTime, only=None):
+    config = loadConfig()
+    config["headless"] = True
+    board.setup(config)
+
+    results = {}
+    for name, case in cases(config["journey"]):
+        if only and only not in name:
+            continue
+        # the parsers print as they go, which would be most of what was timed
+        with contextlib.redirect_stdout(io.StringIO()):
+            mean, best = measure(case, minTime)
+            peak = peakAllocation(case)
+        results[name] = {
+            "mean_us": mean * 1e6,
+            "best_us": best * 1e6,
+            "calls_per_s": 1 / mean if mean else 0,
+            "peak_kb": peak / 1024
+        }
+        print(f"{name:<52} {mean * 1e6:10.1f} us  {best * 1e6:10.1f} us best  "
+              f"{1 / mean:10.0f}/s  {peak / 1024:8.1f} KB peak")
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'case':<52} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<52} {'':>10} {result['mean_us']:10.1f}     (new)")
+            continue
+        change = 100 * (result["mean_us"] - before["mean_us"]) / before["mean_us"]
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<52} {before['mean_us']:10.1f} {result['mean_us']:10.1f} {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="compare with the results saved in this file")
+    parser.add_argument("--threshold", type=float, default=10, help="percent slower that counts as a regression")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend timing each case")
+    parser.add_argument("--only", help="only run cases whose name contains this")
+    args = parser.parse_args()
+
+    results = run(args.min_time, args.only)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the time the two compositors take to produce frames for a full
+departure board: the PIL BoardViewport and the NumPy ArrayViewport.
+
+    python3 benchmarks/bench_compositor.py [frames]
+
+Frames are written to a noop serial interface, so this measures composition
+and packing only, not the SPI transfer itself.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from PIL import ImageFont
+from luma.core.interface.serial import noop
+from luma.core.virtual import snapshot
+from luma.oled.device import ssd1322
+
+from display import BoardViewport, DamageFramebuffer
+from compositor import ArrayViewport, numpyAvailable
+from glyphatlas import getAtlas
+from widgets import Clock, StationScroller
+
+FONTS = os.path.join(os.path.dirname(__file__), "..", "src", "fonts")
+
+
+def makeFont(name, size):
+    return ImageFont.truetype(os.path.join(FONTS, name), size, layout_engine=ImageFont.Layout.BASIC)
+
+
+font = makeFont("Dot Matrix Regular.ttf", 10)
+fontBold = makeFont("Dot Matrix Bold.ttf", 10)
+fontBoldTall = makeFont("Dot Matrix Bold Tall.ttf", 10)
+fontBoldLarge = makeFont("Dot Matrix Bold.ttf", 20)
+
+
+def renderText(text, textFont, right=False):
+    _, _, bitmap = getAtlas(textFont).render(text)
+
+    def drawText(draw, width, *_):
+        x = width - bitmap.width if right else 0
+        draw.bitmap((x, 0), bitmap, fill="yellow")
+    return drawText
+
+
+def buildBoard(viewport, interval):
+    rows = [
+        (0, fontBold, "1st  10:15  London Paddington", "On time", "Plat 4"),
+        (24, font, "2nd  10:21  Oxford", "Exp 10:24", "Plat 2"),
+        (36, font, "3rd  10:32  Didcot Parkway", "Cancelled", "Plat 11"),
+    ]
+    w = int(font.getlength("Exp 00:00"))
+    pw = int(font.getlength("Plat 88"))
+    callingWidth = int(font.getlength("Calling at: "))
+    width = viewport.width
+    for y, rowFont, destination, status, platform in rows:
+        viewport.add_hotspot(snapshot(width - w - pw, 10, renderText(destination, rowFont), interval=interval), (0, y))
+        viewport.add_hotspot(snapshot(w, 10, renderText(status, font, right=True), interval=interval), (width - w, y))
+        viewport.add_hotspot(snapshot(pw, 10, renderText(platform, font), interval=interval), (width - w - pw, y))
+    viewport.add_hotspot(snapshot(callingWidth, 10, renderText("Calling at: ", font), interval=interval), (0, 12))
+    stations = "Reading, Slough, Maidenhead, Twyford, Didcot Parkway, Oxford and Banbury (arr 11:40)."
+    scroller = StationScroller(width - callingWidth, 10, getAtlas(font).render(stations), 35, 0.6)
+    viewport.add_hotspot(scroller, (callingWidth, 12))
+    viewport.add_hotspot(Clock(width, 14, fontBoldLarge, fontBoldTall), (0, 50))
+    return scroller
+
+
+def bench(viewportClass, mode, rotate, frames, force):
+    device = ssd1322(noop(), mode=mode, rotate=rotate, framebuffer=DamageFramebuffer())
+    viewport = viewportClass(device, width=256, height=64)
+    # a tiny interval redraws every row every frame, the worst case
+    scroller = buildBoard(viewport, 1e-9 if force else 3600)
+    viewport.refresh()
+
+    started = time.perf_counter()
+    for _ in range(frames):
+        # move the scroll on a pixel each frame rather than waiting for it
+        scroller.started -= 1 / scroller.speed
+        viewport.refresh(force=force)
+    elapsed = time.perf_counter() - started
+    return 1000 * elapsed / frames
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    if not numpyAvailable():
+        print("NumPy is not installed, only the PIL compositor can be measured")
+
+    print(f"{frames} frames per case, ms per frame")
+    for mode in ("1", "RGB"):
+        for force, case in ((False, "scroll + clock"), (True, "every row redrawn")):
+            results = [("pil", bench(BoardViewport, mode, 2, frames, force))]
+            if numpyAvailable():
+                results.append(("numpy", bench(ArrayViewport, mode, 2, frames, force)))
+            line = "  ".join(f"{name} {ms:7.3f}" for name, ms in results)
+            print(f"mode {mode:>3}  {case:<18} {line}")
+
+
+if __name__ == "__main__":
+    main()
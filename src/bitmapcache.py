@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+
+class BitmapCache:
+    """ Least-recently-used cache of rendered text bitmaps, bounded by the
+    number of bytes the bitmaps take up rather than by entry count. """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def peek(self, key):
+        """ The cached value without counting a lookup or refreshing its age """
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if size > self.maxBytes:
+                # would evict everything else and still not fit, so don't keep it
+                return
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.maxBytes:
+                _, (_, evictedSize) = self.entries.popitem(last=False)
+                self.bytes -= evictedSize
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes
+            }
+
+    def report(self):
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hitRate = 100 * stats["hits"] / lookups if lookups else 0
+        return (f"{stats['entries']} bitmaps, {stats['bytes'] // 1024}/{self.maxBytes // 1024}KB, "
+                f"{hitRate:.1f}% hits, {stats['misses']} misses, {stats['evictions']} evictions")
@@ -0,0 +1,81 @@
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+# which kind of board a departure came from
+DEPARTURE = "departure"
+ARRIVAL = "arrival"
+
+timePattern = re.compile(r"^(\d{2}):(\d{2})$")
+
+
+def minuteOfDay(value):
+    """ 'HH:MM' as minutes past midnight, None for 'On time', 'Cancelled' etc """
+    if value is None:
+        return None
+    match = timePattern.match(value)
+    if match is None:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def minutesUntil(minutes, now):
+    """ Minutes from now until the minute of the day given, negative if it has
+    passed, taking times within 12 hours either side of midnight as the
+    nearer day's """
+    minutesAway = minutes - (now.hour * 60 + now.minute)
+    if minutesAway < -720:
+        minutesAway += 1440
+    elif minutesAway > 720:
+        minutesAway -= 1440
+    return minutesAway
+
+
+def normalisePlatform(platform):
+    """ The form platforms are compared in, upper case without leading zeros,
+    so 'bus' matches 'BUS' and '03a' matches '3A'. None if there isn't one """
+    if platform is None:
+        return None
+    platform = platform.strip().upper()
+    if not platform:
+        return None
+    return platform.lstrip("0") or "0"
+
+
+def platformIndex(departures):
+    """ normalised platform -> the departures from it, in board order """
+    index = {}
+    for departure in departures:
+        platform = normalisePlatform(departure.platform)
+        if platform is not None:
+            index.setdefault(platform, []).append(departure)
+    return {platform: tuple(platformDepartures) for platform, platformDepartures in index.items()}
+
+
+@dataclass(frozen=True, slots=True)
+class CallingPoint:
+    location_name: str
+    crs: Optional[str] = None
+    scheduled_time: Optional[str] = None
+    # 'et' from the API, or 'at' once the train has been there
+    expected_time: Optional[str] = None
+    scheduled_minutes: Optional[int] = None
+    expected_minutes: Optional[int] = None
+
+
+@dataclass(frozen=True, slots=True)
+class Departure:
+    kind: str
+    # std/etd on a departure board, sta/eta on an arrival board
+    aimed_time: str
+    expected_time: Optional[str]
+    destination_name: str
+    calling_at_list: str
+    platform: Optional[str] = None
+    carriages: Union[str, int] = 0
+    operator: Optional[str] = None
+    service_id: Optional[str] = None
+    aimed_minutes: Optional[int] = None
+    expected_minutes: Optional[int] = None
+    # one tuple of calling points per portion of the train
+    calling_points: Tuple[Tuple[CallingPoint, ...], ...] = ()
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from datetime import datetime
+
+from board import minutesUntil
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """ Stops calling a failing API. After threshold failures in a row the
+    circuit opens and calls are refused for baseDelay seconds, doubling each
+    time it opens again up to maxDelay, with some jitter so a fleet of boards
+    doesn't come back in lockstep. Once the delay is up one call is let
+    through; if that works the circuit closes, otherwise it opens for longer. """
+
+    def __init__(self, threshold=3, baseDelay=15, maxDelay=600, clock=time.monotonic):
+        self.threshold = max(1, threshold)
+        self.baseDelay = baseDelay
+        self.maxDelay = max(baseDelay, maxDelay)
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.openUntil = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN:
+                if self.clock() < self.openUntil:
+                    return False
+                self.state = HALF_OPEN
+            return True
+
+    def success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                delay = self.baseDelay * (2 ** self.trips) * random.uniform(0.8, 1.2)
+                self.openUntil = self.clock() + min(self.maxDelay, delay)
+                self.trips += 1
+                self.state = OPEN
+
+    def retryIn(self):
+        """ Seconds until a call is worth trying again: None while all is well,
+        baseDelay after a failure that didn't open the circuit, otherwise
+        however long it has left to stay open """
+        with self.lock:
+            if self.state == OPEN:
+                return max(0.0, self.openUntil - self.clock())
+            if self.failures:
+                return self.baseDelay
+            return None
+
+
+class BoardCache:
+    """ The last board fetched successfully and when it was fetched, so it can
+    keep being shown through failed fetches. Services are dropped from it once
+    they have left, and it is given up on entirely after maxAge seconds. """
+
+    def __init__(self, maxAge=1800):
+        self.maxAge = maxAge
+        self.board = None
+        self.fetchedAt = 0.0
+        # counts boards stored, so anything following along can tell there's a new one
+        self.stored = 0
+        self.lock = threading.Lock()
+
+    def store(self, board, fetchedAt=None):
+        with self.lock:
+            self.board = board
+            self.fetchedAt = fetchedAt or time.time()
+            self.stored += 1
+
+    def age(self):
+        return time.time() - self.fetchedAt
+
+    def stale(self, now=None):
+        """ The cached (departures, firstDepartureDestinations, stationName)
+        without the services that have gone since, or None if there isn't one
+        young enough """
+        with self.lock:
+            board, fetchedAt = self.board, self.fetchedAt
+        if board is None or time.time() - fetchedAt > self.maxAge:
+            return None
+
+        departures, firstDepartureDestinations, stationName = board
+        if departures is False:
+            return board
+
+        now = now or datetime.now()
+        remaining = [departure for departure in departures if not hasGone(departure, now)]
+        if not remaining:
+            return False, False, stationName
+        if remaining[0] is departures[0]:
+            return remaining, firstDepartureDestinations, stationName
+        return remaining, remaining[0].calling_at_list, stationName
+
+
+def hasGone(departure, now):
+    """ Whether a departure's time, expected if known or else aimed, has passed.
+    'Delayed' services with no expected time are kept, as they haven't left. """
+    if departure.expected_minutes is not None:
+        departs = departure.expected_minutes
+    elif departure.expected_time == "Delayed":
+        return False
+    else:
+        departs = departure.aimed_minutes
+    if departs is None:
+        return False
+    return minutesUntil(departs, now) < 0
@@ -0,0 +1,92 @@
+from xml.etree.ElementTree import XMLPullParser
+
+# OpenLDBWS prefixes (lt4:, lt5:, lt7: ...) map to dated namespaces that change
+# between API versions, so everything below matches on the local tag name only
+
+SERVICE_CONTAINERS = ("trainServices", "busServices", "ferryServices", "destination")
+SERVICE_FIELDS = ("std", "etd", "sta", "eta", "platform", "length", "operator", "serviceType", "serviceID")
+CALLING_POINT_FIELDS = ("locationName", "crs", "st", "et", "at")
+NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+FEED_SIZE = 16384
+
+
+def localName(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def readLocations(element):
+    locations = []
+    for location in element:
+        fields = {}
+        for child in location:
+            fields[localName(child.tag)] = child.text
+        locations.append(fields)
+    return locations
+
+
+def readCallingPoints(element):
+    # one list per portion of the train; a splitting train has several
+    callingPointLists = []
+    for callingPointList in element:
+        callingPoints = []
+        for callingPoint in callingPointList:
+            fields = {}
+            for child in callingPoint:
+                name = localName(child.tag)
+                if name in CALLING_POINT_FIELDS:
+                    fields[name] = child.text
+            callingPoints.append(fields)
+        callingPointLists.append(callingPoints)
+    return callingPointLists
+
+
+def readService(element, container):
+    service = {"container": container}
+    for child in element:
+        name = localName(child.tag)
+        if name in SERVICE_FIELDS:
+            service[name] = child.text
+        elif name == "origin" or name == "destination":
+            service[name] = readLocations(child)
+        elif name == "subsequentCallingPoints" or name == "previousCallingPoints":
+            service[name] = readCallingPoints(child)
+    return service
+
+
+class BoardReader:
+    """ Pull-parses an OpenLDBWS SOAP response in a single pass, yielding one
+    plain dict per service as soon as its element closes and then dropping it
+    from the tree. stationName and fault are filled in as they are read. """
+
+    def __init__(self, APIOut):
+        self.APIOut = APIOut
+        self.stationName = None
+        self.fault = None
+
+    def __iter__(self):
+        parser = XMLPullParser(events=("start", "end"))
+        stack = []
+
+        for offset in range(0, len(self.APIOut), FEED_SIZE):
+            parser.feed(self.APIOut[offset:offset + FEED_SIZE])
+            for event, element in parser.read_events():
+                if event == "start":
+                    stack.append(element)
+                    continue
+
+                stack.pop()
+                name = localName(element.tag)
+                parentName = localName(stack[-1].tag) if stack else None
+
+                if name == "service" and parentName in SERVICE_CONTAINERS:
+                    if element.get(NIL) != "true":
+                        yield readService(element, parentName)
+                    stack[-1].remove(element)
+                elif name == "locationName" and parentName in ("GetStationBoardResult", "DeparturesBoard"):
+                    self.stationName = element.text
+                elif name == "faultstring":
+                    self.fault = element.text
+                elif name == "Fault" and self.fault is None:
+                    self.fault = "soap:Fault"
+        parser.close()
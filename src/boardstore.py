@@ -0,0 +1,143 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from dataclasses import fields
+
+from PIL import Image
+
+from board import CallingPoint, Departure
+
+# file layout: MAGIC, the length of the JSON header, the header, then the raw
+# bytes of each 'L' bitmap one after another, found by the offsets in the header
+MAGIC = b"DBS1"
+HEADER = struct.Struct("<4sI")
+
+DEPARTURE_FIELDS = [field.name for field in fields(Departure)]
+CALLING_POINT_FIELDS = [field.name for field in fields(CallingPoint)]
+
+
+def packDeparture(departure):
+    values = [getattr(departure, name) for name in DEPARTURE_FIELDS]
+    values[-1] = [[[getattr(point, name) for name in CALLING_POINT_FIELDS] for point in portion]
+                  for portion in departure.calling_points]
+    return values
+
+
+def unpackDeparture(values):
+    callingPoints = tuple(tuple(CallingPoint(*point) for point in portion) for portion in values[-1])
+    return Departure(*values[:-1], calling_points=callingPoints)
+
+
+class BoardStore:
+    """ Keeps the last board fetched, and the text bitmaps drawn for it, in a
+    file so that after a restart the board can be shown straight away while
+    the first fetch is still going. The file is replaced atomically so a power
+    cut part way through a write leaves the previous one intact, and read back
+    through mmap. fonts maps a name to each font the bitmaps were drawn in. """
+
+    def __init__(self, path, fonts):
+        self.path = path
+        self.fonts = fonts
+        self.fontNames = {font: name for name, font in fonts.items()}
+        self.writing = threading.Lock()
+        # the newest board waiting to be written, by the one writer thread
+        self.pending = None
+        self.queued = threading.Condition()
+        self.writer = None
+
+    def save(self, board, fetchedAt, bitmaps):
+        """ board is (departures, firstDepartureDestinations, stationName) and
+        bitmaps the ((text, font), (width, height, bitmap)) to keep with it """
+        departures, firstDepartureDestinations, stationName = board
+        entries = []
+        chunks = []
+        offset = 0
+        for (text, font), (width, height, bitmap) in bitmaps:
+            fontName = self.fontNames.get(font)
+            if fontName is None or bitmap.mode != "L" or 0 in bitmap.size:
+                continue
+            data = bitmap.tobytes()
+            entries.append([text, fontName, width, height, bitmap.width, bitmap.height, offset, len(data)])
+            chunks.append(data)
+            offset += len(data)
+
+        header = json.dumps({
+            "departureFields": DEPARTURE_FIELDS,
+            "callingPointFields": CALLING_POINT_FIELDS,
+            "fetchedAt": fetchedAt,
+            "departures": [packDeparture(departure) for departure in departures] if departures else False,
+            "firstDepartureDestinations": firstDepartureDestinations,
+            "stationName": stationName,
+            "bitmaps": entries
+        }, separators=(",", ":")).encode("utf-8")
+
+        with self.writing:
+            temporary = self.path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(header)))
+                f.write(header)
+                for chunk in chunks:
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+
+    def saveInBackground(self, board, fetchedAt, bitmaps):
+        """ Queues the board to be written by a single writer thread, so saves
+        land in the order they were made. A board still waiting when a newer
+        one arrives is never written. """
+        # the board and bitmaps are never changed once made, so can be written
+        # out on another thread without holding up the next frame
+        with self.queued:
+            self.pending = (board, fetchedAt, bitmaps)
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.writeQueued, name="BoardStore", daemon=True)
+                self.writer.start()
+            self.queued.notify()
+
+    def writeQueued(self):
+        while True:
+            with self.queued:
+                self.queued.wait_for(lambda: self.pending is not None)
+                board, fetchedAt, bitmaps = self.pending
+                self.pending = None
+            try:
+                self.save(board, fetchedAt, bitmaps)
+            except OSError as err:
+                print(f"Error: Failed to save the board to {self.path}: {err}")
+
+    def load(self):
+        """ (board, fetchedAt, bitmaps) as saved, or None if there's no file or
+        it can't be used """
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, headerLength = HEADER.unpack_from(mapped, 0)
+                if magic != MAGIC:
+                    return None
+                start = HEADER.size + headerLength
+                header = json.loads(mapped[HEADER.size:start])
+                if (header["departureFields"] != DEPARTURE_FIELDS
+                        or header["callingPointFields"] != CALLING_POINT_FIELDS):
+                    # saved by a version with different departure records
+                    return None
+
+                bitmaps = []
+                for text, fontName, width, height, bitmapWidth, bitmapHeight, offset, length in header["bitmaps"]:
+                    font = self.fonts.get(fontName)
+                    if font is None:
+                        continue
+                    bitmap = Image.frombytes("L", (bitmapWidth, bitmapHeight),
+                                             mapped[start + offset:start + offset + length])
+                    bitmaps.append(((text, font), (width, height, bitmap)))
+        except (OSError, ValueError, KeyError, struct.error) as err:
+            if not isinstance(err, FileNotFoundError):
+                print(f"Error: Failed to load the board from {self.path}: {err}")
+            return None
+
+        departures = header["departures"]
+        if departures:
+            departures = [unpackDeparture(values) for values in departures]
+        board = (departures, header["firstDepartureDestinations"], header["stationName"])
+        return board, header["fetchedAt"], bitmaps
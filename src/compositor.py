@@ -0,0 +1,144 @@
+import zlib
+
+from PIL import Image
+from luma.core.virtual import pool, calc_bounds
+
+from display import DamageFramebuffer, rotateRect, mergeRects
+from metrics import timed
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def numpyAvailable():
+    return numpy is not None
+
+
+def toNibbles(image):
+    """ A hotspot image as an array of the 4-bit levels the SSD1322 shows,
+    using the same conversion luma applies to whole frames """
+    if image.mode == "1":
+        return numpy.asarray(image, dtype=numpy.uint8) * 0x0F
+    if image.mode == "L":
+        return numpy.asarray(image, dtype=numpy.uint8) >> 4
+    rgb = numpy.asarray(image.convert("RGB"), dtype=numpy.uint32)
+    grey = (rgb[..., 0] * 306 + rgb[..., 1] * 601 + rgb[..., 2] * 117) >> 14
+    return grey.astype(numpy.uint8)
+
+
+def packNibbles(levels, nibbleOrder=0):
+    # two pixels to a byte, the first pixel in the high nibble unless the
+    # controller stores them the other way round
+    first, second = levels[:, 0::2], levels[:, 1::2]
+    if nibbleOrder:
+        first, second = second, first
+    return (first << 4) | second
+
+
+class ArrayViewport:
+    """ Drop-in alternative to BoardViewport that keeps the frame as a NumPy
+    array of 4-bit levels. Redrawn hotspots are copied in as array slices and
+    the changed windows are packed and written straight to the SSD1322, which
+    skips building, rotating and converting a PIL image for every frame.
+
+    Only the parts of the viewport interface drawSignage and friends use are
+    provided: hotspots are always fully in view, there is no scrolling. """
+
+    def __init__(self, device, width, height):
+        self._device = device
+        self.width = width
+        self.height = height
+        self._hotspots = []
+        self.frame = numpy.zeros((height, width), dtype=numpy.uint8)
+        self.damage = []
+        self.fullFrame = True
+
+    def add_hotspot(self, hotspot, xy):
+        x, y = xy
+        assert 0 <= x <= self.width - hotspot.width
+        assert 0 <= y <= self.height - hotspot.height
+        self._hotspots.append((hotspot, xy))
+
+    def remove_hotspot(self, hotspot, xy):
+        self._hotspots.remove((hotspot, xy))
+        rect = self.clip(calc_bounds(xy, hotspot))
+        if rect is not None:
+            left, top, right, bottom = rect
+            self.frame[top:bottom, left:right] = 0
+            self.damage.append(rect)
+
+    def clip(self, rect):
+        left, top, right, bottom = rect
+        rect = (max(left, 0), max(top, 0), min(right, self.width), min(bottom, self.height))
+        if rect[0] < rect[2] and rect[1] < rect[3]:
+            return rect
+        return None
+
+    def blit(self, hotspot, xy):
+        # paste_into rather than update, so snapshots note when they were drawn
+        image = Image.new(self._device.mode, (hotspot.width, hotspot.height))
+        hotspot.paste_into(image, (0, 0))
+        levels = toNibbles(image)
+        x, y = xy
+        left, top, right, bottom = self.clip(calc_bounds(xy, hotspot))
+        self.frame[top:bottom, left:right] = levels[top - y:bottom - y, left - x:right - x]
+
+    def refresh(self, force=False):
+        redrawn = False
+        with timed("compose"):
+            for hotspot, xy in self._hotspots:
+                if hotspot.should_redraw():
+                    rect = self.clip(calc_bounds(xy, hotspot))
+                    if rect is None:
+                        continue
+                    pool.add_task(self.blit, hotspot, xy)
+                    self.damage.append(rect)
+                    redrawn = True
+
+            if redrawn:
+                pool.wait_completion()
+
+        device = self._device
+        framebuffer = getattr(device, "framebuffer", None)
+        if not isinstance(framebuffer, DamageFramebuffer):
+            framebuffer = None
+
+        full = force or self.fullFrame
+        if not (full or self.damage):
+            if framebuffer is not None:
+                framebuffer.framesSkipped += 1
+            return
+
+        frame = self.frame[:device.height, :device.width]
+        fingerprint = zlib.crc32(frame.tobytes())
+        if framebuffer is not None:
+            if not full and fingerprint == framebuffer.fingerprint:
+                framebuffer.framesSkipped += 1
+                self.damage = []
+                return
+            framebuffer.fingerprint = fingerprint
+            framebuffer.framesSent += 1
+
+        # numpy turns anticlockwise, luma's rotate setting is clockwise
+        panel = numpy.rot90(frame, -device.rotate)
+        panelHeight, panelWidth = panel.shape
+        if full:
+            rects = [(0, 0, panelWidth, panelHeight)]
+        else:
+            rects = mergeRects([rotateRect(rect, device.rotate, device.width, device.height)
+                                for rect in self.damage])
+
+        nibbleOrder = getattr(device, "_nibble_order", 0)
+        with timed("display_output"):
+            for rect in rects:
+                left, top, right, bottom = device._inflate_bbox(rect)
+                packed = packNibbles(panel[top:bottom, left:right], nibbleOrder)
+                device._set_position(top, right, bottom, left)
+                device.data(bytearray(packed.tobytes()))
+                if framebuffer is not None:
+                    framebuffer.pixelsSent += (right - left) * (bottom - top)
+
+        self.damage = []
+        self.fullFrame = False
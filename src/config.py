@@ -1,3 +1,4 @@
+import json
 import os
 import re
 from typing import Dict, Union
@@ -11,6 +12,36 @@ def parsePlatformData(platform):
     else:
         return ""
 
+# SPI port, chip select and the DC/RST GPIO pins luma uses unless told otherwise
+SCREEN_DEFAULTS = {"port": 0, "device": 0, "gpioDC": 24, "gpioRST": 25}
+
+
+def parseScreens(screens, data):
+    """ The screen definitions, either from the screens JSON list or, when
+    that isn't set, the one or two screens of dualScreen/screenNPlatform """
+    if not screens:
+        definitions = [dict(SCREEN_DEFAULTS, platform=data["journey"]["screen1Platform"])]
+        if data["dualScreen"]:
+            definitions.append(dict(SCREEN_DEFAULTS, port=1, gpioDC=5, gpioRST=6,
+                                    platform=data["journey"]["screen2Platform"]))
+        screens = definitions
+    else:
+        screens = json.loads(screens)
+        if not isinstance(screens, list) or not screens:
+            raise ValueError("screens must be a JSON list with at least one screen")
+
+    parsed = []
+    for screen in screens:
+        if not isinstance(screen, dict):
+            raise ValueError(f"screen definitions must be JSON objects, not {screen!r}")
+        definition = {key: int(screen.get(key, default)) for key, default in SCREEN_DEFAULTS.items()}
+        definition["rotation"] = int(screen.get("rotation", data["screenRotation"]))
+        platform = screen.get("platform")
+        definition["platform"] = parsePlatformData(None if platform is None else str(platform))
+        parsed.append(definition)
+    return parsed
+
+
 def loadConfig():
     data = {
         "journey": {},
@@ -19,9 +50,21 @@ def loadConfig():
 
     data["targetFPS"] = int(os.getenv("targetFPS") or 70)
     data["refreshTime"] = int(os.getenv("refreshTime") or 180)
+    data["adaptiveRefresh"] = False
+    if os.getenv("adaptiveRefresh") == "True":
+        data["adaptiveRefresh"] = True
+    data["refreshMinTime"] = int(os.getenv("refreshMinTime") or 30)
+    data["refreshMaxTime"] = int(os.getenv("refreshMaxTime") or 600)
     data["fpsTime"] = int(os.getenv("fpsTime") or 180)
+    data["scrollSpeed"] = float(os.getenv("scrollSpeed") or 35)
+    data["scrollPause"] = float(os.getenv("scrollPause") or 0.6)
     data["screenRotation"] = int(os.getenv("screenRotation") or 2)
     data["screenBlankHours"] = os.getenv("screenBlankHours") or ""
+    data["blankPrewarm"] = int(os.getenv("blankPrewarm") or 20)
+    data["bitmapCacheKB"] = int(os.getenv("bitmapCacheKB") or 1024)
+    data["metricsPort"] = int(os.getenv("metricsPort") or 0)
+    data["metricsHost"] = os.getenv("metricsHost") or "127.0.0.1"
+    data["compositor"] = (os.getenv("compositor") or "pil").lower()
     data["headless"] = False
     if os.getenv("headless") == "True":
         data["headless"] = True
@@ -67,8 +110,33 @@ def loadConfig():
     data["journey"]["screen1Platform"] = parsePlatformData(os.getenv("screen1Platform"))
     data["journey"]["screen2Platform"] = parsePlatformData(os.getenv("screen2Platform"))
 
+    # balena keeps /data across restarts and updates, so keep the board there
+    # by default; set boardCacheFile to nothing to turn this off
+    data["boardCacheFile"] = os.getenv("boardCacheFile")
+    if data["boardCacheFile"] is None:
+        data["boardCacheFile"] = "/data/board.cache" if os.path.isdir("/data") else ""
+
+    # "publisher" serves the board it fetches to other units, "subscriber"
+    # takes it from fleetPublisher rather than calling the API itself
+    data["fleetMode"] = (os.getenv("fleetMode") or "").lower()
+    data["fleetPublisher"] = os.getenv("fleetPublisher") or ""
+    data["fleetPort"] = int(os.getenv("fleetPort") or 8082)
+    if data["fleetMode"] == "subscriber" and not data["fleetPublisher"]:
+        print("Warning: fleetMode is subscriber but fleetPublisher isn't set, fetching directly")
+        data["fleetMode"] = ""
+
+    data["screens"] = parseScreens(os.getenv("screens"), data)
+
     data["api"]["apiKey"] = os.getenv("apiKey") or None
+    data["api"]["url"] = os.getenv("apiURL") or None
     data["api"]["operatingHours"] = os.getenv("operatingHours") or ""
+    data["api"]["connectTimeout"] = float(os.getenv("connectTimeout") or 5)
+    data["api"]["readTimeout"] = float(os.getenv("readTimeout") or 15)
+    data["api"]["retries"] = int(os.getenv("apiRetries") or 2)
+    data["api"]["staleMaxAge"] = int(os.getenv("staleMaxAge") or 1800)
+    data["api"]["failureThreshold"] = int(os.getenv("apiFailureThreshold") or 3)
+    data["api"]["backoffTime"] = float(os.getenv("apiBackoffTime") or 15)
+    data["api"]["backoffMaxTime"] = float(os.getenv("apiBackoffMaxTime") or 600)
 
     data["showDepartureNumbers"] = False
     if os.getenv("showDepartureNumbers") == "True":
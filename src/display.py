@@ -0,0 +1,142 @@
+import zlib
+
+from luma.core.virtual import viewport, pool, calc_bounds
+
+from metrics import timed
+
+
+def rotateRect(rect, rotate, width, height):
+    """ Map a rectangle on the logical (unrotated) display onto the panel """
+    left, top, right, bottom = rect
+    if rotate == 1:
+        return (height - bottom, left, height - top, right)
+    if rotate == 2:
+        return (width - right, height - bottom, width - left, height - top)
+    if rotate == 3:
+        return (top, width - right, bottom, width - left)
+    return (left, top, right, bottom)
+
+
+def mergeRects(rects, slack=256):
+    # combine rectangles when one window costs little more than two, each
+    # window written to the panel carries its own set of address commands
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r[1], r[0])):
+        for n, other in enumerate(merged):
+            union = (min(rect[0], other[0]), min(rect[1], other[1]),
+                     max(rect[2], other[2]), max(rect[3], other[3]))
+            area = (union[2] - union[0]) * (union[3] - union[1])
+            separate = ((rect[2] - rect[0]) * (rect[3] - rect[1]) +
+                        (other[2] - other[0]) * (other[3] - other[1]))
+            if area <= separate + slack:
+                merged[n] = union
+                break
+        else:
+            merged.append(rect)
+    return merged
+
+
+class DamageFramebuffer:
+    """ luma framebuffer that only redraws the regions a BoardViewport reports
+    as changed, rather than diffing whole frames. Anything displayed without
+    damage information (device.clear() for example) is sent as a full frame. """
+
+    def __init__(self):
+        self.damage = None
+        # crc32 of the last frame a viewport sent, None if unknown
+        self.fingerprint = None
+        self.pendingFingerprint = None
+        self.pixelsSent = 0
+        self.framesSent = 0
+        self.framesSkipped = 0
+
+    def redraw(self, image):
+        damage, self.damage = self.damage, None
+        self.fingerprint, self.pendingFingerprint = self.pendingFingerprint, None
+        self.framesSent += 1
+        if damage is None:
+            self.pixelsSent += image.width * image.height
+            yield image, (0, 0) + image.size
+            return
+
+        for rect in mergeRects(damage):
+            self.pixelsSent += (rect[2] - rect[0]) * (rect[3] - rect[1])
+            yield image.crop(rect), rect
+
+
+class BoardViewport(viewport):
+    """ A luma viewport that keeps track of which hotspots were redrawn and
+    passes just those areas down to a DamageFramebuffer, so only the changed
+    column/row windows of the SSD1322 are written over SPI. """
+
+    def __init__(self, device, width, height, **kwargs):
+        super().__init__(device, width, height, **kwargs)
+        self.damage = []
+        # the first frame on a device has to replace whatever the last screen left
+        self.fullFrame = True
+
+    def remove_hotspot(self, hotspot, xy):
+        super().remove_hotspot(hotspot, xy)
+        self.damage.append(calc_bounds(xy, hotspot))
+
+    def display(self, image):
+        self.fullFrame = True
+        super().display(image)
+
+    def set_position(self, xy):
+        self.fullFrame = True
+        super().set_position(xy)
+
+    def refresh(self, force=False):
+        should_wait = False
+        with timed("compose"):
+            for hotspot, xy in self._hotspots:
+                if hotspot.should_redraw() and self.is_overlapping_viewport(hotspot, xy):
+                    pool.add_task(hotspot.paste_into, self._backing_image, xy)
+                    self.damage.append(calc_bounds(xy, hotspot))
+                    should_wait = True
+
+            if should_wait:
+                pool.wait_completion()
+
+        framebuffer = getattr(self._device, "framebuffer", None)
+        if not isinstance(framebuffer, DamageFramebuffer):
+            framebuffer = None
+
+        if force or should_wait or self._dirty or self.fullFrame:
+            im = self._backing_image.crop(box=self._crop_box())
+            if self._dither:
+                im = im.convert(self._device.mode)
+
+            if framebuffer is not None:
+                # a redrawn hotspot often produces exactly the same pixels (a
+                # paused scroll, an unchanged row), so don't send it again
+                fingerprint = zlib.crc32(im.tobytes())
+                if not (force or self.fullFrame):
+                    if fingerprint == framebuffer.fingerprint:
+                        framebuffer.framesSkipped += 1
+                        self.damage = []
+                        self._dirty = False
+                        return
+                    framebuffer.damage = self.deviceDamage()
+                framebuffer.pendingFingerprint = fingerprint
+
+            with timed("display_output"):
+                self._device.display(im)
+            self._dirty = False
+            self.fullFrame = False
+        elif framebuffer is not None:
+            framebuffer.framesSkipped += 1
+        self.damage = []
+
+    def deviceDamage(self):
+        # viewport coordinates -> device coordinates -> rotated panel coordinates
+        left, top, right, bottom = self._crop_box()
+        device = self._device
+        rects = []
+        for rect in self.damage:
+            clipped = (max(rect[0], left) - left, max(rect[1], top) - top,
+                       min(rect[2], right) - left, min(rect[3], bottom) - top)
+            if clipped[0] < clipped[2] and clipped[1] < clipped[3]:
+                rects.append(rotateRect(clipped, device.rotate, device.width, device.height))
+        return rects
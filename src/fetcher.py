@@ -0,0 +1,96 @@
+import threading
+import time
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Union
+
+from board import platformIndex
+from metrics import timed
+
+
+class BoardSnapshot(NamedTuple):
+    # indexes 0-2 match the (departures, firstDepartureDestinations, stationName)
+    # tuple returned by loadData, so a snapshot can be used anywhere that was
+    departures: Union[tuple, bool]
+    firstDepartureDestinations: Union[str, bool]
+    stationName: str
+    generation: int
+    fetchedAt: float
+    # normalised platform -> departures from it, so each screen's board is a lookup
+    platforms: Mapping[str, tuple]
+
+
+def freezeBoard(data, generation, fetchedAt=None):
+    departures, firstDepartureDestinations, stationName = data
+    platforms = {}
+    if departures is not False:
+        # Departure records are frozen, so only the list needs freezing
+        departures = tuple(departures)
+        platforms = platformIndex(departures)
+    return BoardSnapshot(departures, firstDepartureDestinations, stationName, generation, fetchedAt or time.time(),
+                         MappingProxyType(platforms))
+
+
+class BoardFetcher:
+    """ Calls fetch() on a background thread every interval seconds and publishes
+    the result as an immutable BoardSnapshot, so a slow API call never blocks
+    the render loop. fetch() returns (data, fetchedAt), fetchedAt being when
+    the board was fetched from the API, which is older than now when a cached
+    board is shown again; or None to skip publishing. interval may
+    also be a function, given the new snapshot (None if nothing was published)
+    and returning the seconds to wait before the next fetch. A ValueError from
+    fetch() is a configuration problem and stops the fetcher; anything else is
+    printed and the next fetch goes ahead as usual. """
+
+    def __init__(self, fetch, interval):
+        self.fetch = fetch
+        self.interval = interval
+        self.generation = 0
+        self.snapshot = None
+        self.error = None
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="BoardFetcher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def refreshNow(self):
+        self.wake.set()
+
+    def publish(self, data, fetchedAt=None):
+        self.generation += 1
+        # publishing is a single reference swap, the render loop picks it up
+        # at the start of its next frame
+        self.snapshot = freezeBoard(data, self.generation, fetchedAt)
+        return self.snapshot
+
+    def latest(self):
+        # configuration errors raised by fetch() are re-raised on the render
+        # thread so they still stop the display as they did before
+        if self.error is not None:
+            raise self.error
+        return self.snapshot
+
+    def run(self):
+        while True:
+            try:
+                with timed("fetch"):
+                    fetched = self.fetch()
+            except ValueError as err:
+                self.error = err
+                return
+            except Exception as err:
+                # anything else may be gone by the next fetch, so keep showing
+                # the board there is and try again
+                print(f"Error: Failed to fetch the board: {err!r}")
+                fetched = None
+
+            snapshot = None
+            if fetched is not None:
+                data, fetchedAt = fetched
+                snapshot = self.publish(data, fetchedAt)
+
+            interval = self.interval
+            if callable(interval):
+                interval = interval(snapshot)
+            self.wake.wait(interval)
+            self.wake.clear()
@@ -0,0 +1,189 @@
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from boardcache import CircuitBreaker
+from boardstore import DEPARTURE_FIELDS, packDeparture, unpackDeparture
+
+SERVICE_ID = DEPARTURE_FIELDS.index("service_id")
+
+
+class FleetUnavailable(Exception):
+    pass
+
+
+def packBoard(board, fetchedAt):
+    departures, firstDepartureDestinations, stationName = board
+    return {
+        "departures": [packDeparture(departure) for departure in departures] if departures else False,
+        "first": firstDepartureDestinations,
+        "station": stationName,
+        "fetchedAt": fetchedAt
+    }
+
+
+def serviceIds(departures):
+    """ service_id -> packed departure, or None if they can't be told apart """
+    if not departures:
+        return {}
+    ids = {departure[SERVICE_ID]: departure for departure in departures}
+    if None in ids or len(ids) != len(departures):
+        return None
+    return ids
+
+
+class FleetPublisher:
+    """ Serves the board this unit fetched to the rest of a fleet, so many
+    displays watching the same station share one set of API calls.
+
+    Subscribers long-poll GET /board?run=...&since=<version>&wait=<seconds>:
+    the request is held until there is a board newer than since, or wait
+    seconds pass (204). If the subscriber has a recent board the answer is a
+    delta against it, in which departures it already has are sent as just
+    their service_id; otherwise it's the whole board. run changes each time
+    the publisher starts, so versions from before a restart aren't trusted. """
+
+    HISTORY = 8
+
+    def __init__(self, host, port, maxWait=60):
+        self.run = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.boards = {}
+        self.encoded = {}
+        self.maxWait = maxWait
+        self.changed = threading.Condition()
+
+        publisher = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/board":
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                try:
+                    since = int(query.get("since", ["0"])[0])
+                    wait = min(float(query.get("wait", ["0"])[0]), publisher.maxWait)
+                except ValueError:
+                    self.send_error(400)
+                    return
+                body = publisher.waitForBoard(query.get("run", [""])[0], since, wait)
+                if body is None:
+                    self.send_response(204)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="FleetPublisher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def publish(self, board, fetchedAt):
+        packed = packBoard(board, fetchedAt)
+        with self.changed:
+            self.version += 1
+            self.boards[self.version] = packed
+            self.boards.pop(self.version - self.HISTORY, None)
+            # encoded answers are only good for the board they were made from
+            self.encoded = {}
+            self.changed.notify_all()
+
+    def waitForBoard(self, run, since, wait):
+        with self.changed:
+            # a subscriber new to this run has nothing, so any board is news
+            known = since if run == self.run else 0
+            self.changed.wait_for(lambda: self.version != known, timeout=wait)
+            if self.version == known:
+                return None
+            base = since if run == self.run and since in self.boards else None
+            body = self.encoded.get(base)
+            if body is None:
+                body = self.encoded[base] = self.encode(base)
+            return body
+
+    def encode(self, base):
+        board = self.boards[self.version]
+        message = {"run": self.run, "version": self.version, "fields": DEPARTURE_FIELDS}
+        baseIds = serviceIds(self.boards[base]["departures"]) if base is not None else None
+        if baseIds and serviceIds(board["departures"]) is not None:
+            # the subscriber has these departures already, unless they've changed
+            board = dict(board, departures=[
+                departure[SERVICE_ID] if baseIds.get(departure[SERVICE_ID]) == departure else departure
+                for departure in board["departures"]])
+            message["base"] = base
+        message["board"] = board
+        return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+class FleetSubscriber:
+    """ Takes the board from a FleetPublisher instead of fetching it. poll()
+    waits up to wait seconds for a new board and returns (board, fetchedAt),
+    or None if there isn't one yet, and raises FleetUnavailable when the
+    publisher can't be reached or its answer can't be used. The breaker then
+    opens, and until it lets another poll through the board should be
+    fetched directly. """
+
+    def __init__(self, url, wait=30, retryTime=30, retryMaxTime=300):
+        self.url = url.rstrip("/") + "/board"
+        self.wait = wait
+        self.session = requests.Session()
+        self.breaker = CircuitBreaker(threshold=1, baseDelay=retryTime, maxDelay=retryMaxTime)
+        self.run = ""
+        self.version = 0
+        self.departures = {}
+        # whether the last poll worked, so the next can follow on straight away
+        self.live = False
+
+    def poll(self):
+        try:
+            response = self.session.get(self.url, params={"run": self.run, "since": self.version, "wait": self.wait},
+                                        timeout=(5, self.wait + 10))
+            response.raise_for_status()
+            board = None
+            if response.status_code != 204:
+                board = self.apply(response.json())
+        except (requests.RequestException, ValueError, KeyError, TypeError) as err:
+            self.live = False
+            self.breaker.failure()
+            # start again from a whole board next time
+            self.run = ""
+            self.version = 0
+            raise FleetUnavailable(str(err)) from err
+        self.live = True
+        self.breaker.success()
+        return board
+
+    def apply(self, message):
+        if message["fields"] != DEPARTURE_FIELDS:
+            raise ValueError("the publisher is running a different version")
+        packed = message["board"]
+        departures = packed["departures"]
+        if "base" in message:
+            if message["base"] != self.version or message["run"] != self.run:
+                raise ValueError("delta against a board this unit doesn't have")
+            departures = [self.departures[item] if isinstance(item, str) else item for item in departures]
+
+        self.run = message["run"]
+        self.version = message["version"]
+        self.departures = serviceIds(departures) or {}
+        if departures:
+            departures = [unpackDeparture(values) for values in departures]
+        return (departures, packed["first"], packed["station"]), packed["fetchedAt"]
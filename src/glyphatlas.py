@@ -0,0 +1,101 @@
+import threading
+
+from PIL import Image, ImageChops, ImageDraw
+
+# printable ASCII is rasterised up front, anything else the first time it's seen
+PRELOAD = "".join(chr(c) for c in range(32, 127))
+
+
+class GlyphAtlas:
+    """ Rasterises each glyph of a font once into a single strip image, so new
+    strings are composed by pasting glyphs out of the strip at the font's
+    advance widths instead of going through FreeType again. """
+
+    def __init__(self, font, preload=PRELOAD):
+        self.font = font
+        self.atlas = Image.new('L', (1, 1), color=0)
+        self.used = 0
+        # char -> (x in atlas, width, height, advance, glyph image)
+        self.glyphs = {}
+        self.lock = threading.Lock()
+        self.addGlyphs(preload)
+
+    def addGlyphs(self, chars):
+        with self.lock:
+            new = [c for c in dict.fromkeys(chars) if c not in self.glyphs]
+            if not new:
+                return
+
+            measured = []
+            width = self.used
+            height = self.atlas.height
+            for c in new:
+                _, _, right, bottom = self.font.getbbox(c)
+                right, bottom = max(right, 0), max(bottom, 0)
+                measured.append((c, right, bottom, self.font.getlength(c)))
+                width += right
+                height = max(height, bottom)
+
+            # grow the strip and draw the new glyphs on the end of it
+            atlas = Image.new('L', (max(width, 1), max(height, 1)), color=0)
+            atlas.paste(self.atlas, (0, 0))
+            draw = ImageDraw.Draw(atlas)
+            x = self.used
+            for c, right, bottom, advance in measured:
+                draw.text((x, 0), text=c, font=self.font, fill=255)
+                x += right
+
+            self.atlas = atlas
+            glyphs = dict(self.glyphs)
+            x = self.used
+            for c, right, bottom, advance in measured:
+                glyphs[c] = (x, right, bottom, advance, atlas.crop((x, 0, x + right, bottom)))
+                x += right
+            self.used = x
+            self.glyphs = glyphs
+
+    def render(self, text):
+        """ (width, height, bitmap) for text, the same as drawing it with FreeType """
+        glyphs = self.glyphs
+        for c in text:
+            if c not in glyphs:
+                self.addGlyphs(text)
+                glyphs = self.glyphs
+                break
+
+        # lay the glyphs out along the pen position first to find the size
+        placed = []
+        pen = 0.0
+        width = 0
+        height = 0
+        for c in text:
+            _, glyphWidth, glyphHeight, advance, glyph = glyphs[c]
+            x = int(pen)
+            if glyphWidth and glyphHeight:
+                placed.append((x, glyph))
+                width = max(width, x + glyphWidth)
+                height = max(height, glyphHeight)
+            pen += advance
+
+        bitmap = Image.new('L', (width, height), color=0)
+        drawnTo = 0
+        for x, glyph in placed:
+            box = (x, 0, x + glyph.width, glyph.height)
+            if x < drawnTo:
+                # where neighbouring glyphs overlap keep the brighter of the two,
+                # as FreeType does, so each keeps its own anti-aliasing levels
+                bitmap.paste(ImageChops.lighter(bitmap.crop(box), glyph), box)
+            else:
+                bitmap.paste(glyph, box)
+            drawnTo = max(drawnTo, box[2])
+        return width, height, bitmap
+
+
+glyphAtlases = {}
+
+
+def getAtlas(font):
+    atlas = glyphAtlases.get(font)
+    if atlas is None:
+        atlas = glyphAtlases[font] = GlyphAtlas(font)
+    return atlas
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe
+
+LDBWS_URL = "https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb11.asmx"
+
+# gateway errors are worth another go, a 500 is how OpenLDBWS returns a
+# soap:Fault so that is handed back to the caller to parse
+RETRY_STATUSES = (502, 503, 504)
+
+
+def buildField(name, value):
+    if isinstance(value, (list, tuple)):
+        # nested lists like <ldb:filterList><ldb:crs>...</ldb:crs></ldb:filterList>
+        inner = "".join(buildField("crs", item) for item in value)
+        return f"<ldb:{name}>{inner}</ldb:{name}>"
+    return f"<ldb:{name}>{escape(str(value))}</ldb:{name}>"
+
+
+def buildRequest(operation, apiKey, fields):
+    body = "".join(buildField(name, value) for name, value in fields)
+    return (
+        '<x:Envelope xmlns:x="http://schemas.xmlsoap.org/soap/envelope/"'
+        ' xmlns:ldb="http://thalesgroup.com/RTTI/2017-10-01/ldb/"'
+        ' xmlns:typ4="http://thalesgroup.com/RTTI/2013-11-28/Token/types">'
+        '<x:Header><typ4:AccessToken><typ4:TokenValue>' + escape(apiKey) + '</typ4:TokenValue></typ4:AccessToken></x:Header>'
+        '<x:Body><ldb:' + operation + '>' + body + '</ldb:' + operation + '></x:Body>'
+        '</x:Envelope>'
+    )
+
+
+class LDBWSClient:
+    """ Keeps one pooled keep-alive session to OpenLDBWS so a refresh reuses a
+    warm TLS connection, with timeouts, bounded jittered retries and per
+    operation latency counters. """
+
+    def __init__(self, url=LDBWS_URL, connectTimeout=5, readTimeout=15, retries=2, backoff=0.5, poolSize=4):
+        self.url = url
+        self.timeout = (connectTimeout, readTimeout)
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'Content-Type': 'text/xml',
+            'Accept-Encoding': 'gzip',
+            'Connection': 'keep-alive'
+        })
+
+        self.stats = {}
+        self.statsLock = threading.Lock()
+
+    def record(self, operation, seconds, retried=False, failed=False):
+        observe("api_request", seconds)
+        with self.statsLock:
+            stat = self.stats.setdefault(operation, {
+                'calls': 0, 'retries': 0, 'errors': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0
+            })
+            stat['calls'] += 1
+            stat['total'] += seconds
+            stat['last'] = seconds
+            stat['max'] = max(stat['max'], seconds)
+            if retried:
+                stat['retries'] += 1
+            if failed:
+                stat['errors'] += 1
+
+    def statsSnapshot(self):
+        """ A copy of the per operation counters, safe to read while requests
+        are still being recorded on other threads """
+        with self.statsLock:
+            return {operation: dict(stat) for operation, stat in self.stats.items()}
+
+    def latencyReport(self):
+        with self.statsLock:
+            parts = []
+            for operation, stat in self.stats.items():
+                mean = stat['total'] / stat['calls'] if stat['calls'] else 0
+                parts.append(f"{operation}: {stat['calls']} calls, mean {mean * 1000:.0f}ms, "
+                             f"last {stat['last'] * 1000:.0f}ms, max {stat['max'] * 1000:.0f}ms, "
+                             f"{stat['retries']} retries, {stat['errors']} errors")
+            return "; ".join(parts)
+
+    def call(self, operation, apiKey, fields):
+        if apiKey is None:
+            raise ValueError(
+                "Please configure the apiKey environment variable")
+
+        payload = buildRequest(operation, apiKey, fields).encode("utf-8")
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.url, data=payload, timeout=self.timeout)
+                if response.status_code in RETRY_STATUSES:
+                    response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+                retrying = attempt < self.retries
+                self.record(operation, time.monotonic() - started, retried=retrying, failed=not retrying)
+                if not retrying:
+                    raise
+                # exponential backoff with jitter so a fleet doesn't retry in lockstep
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                attempt += 1
+                continue
+
+            self.record(operation, time.monotonic() - started)
+            return response.text
+
+
+defaultClient = None
+
+
+def getDefaultClient():
+    global defaultClient
+    if defaultClient is None:
+        defaultClient = LDBWSClient()
+    return defaultClient
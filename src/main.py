@@ -1,19 +1,30 @@
 import os
+import threading
 import time
+from xml.etree.ElementTree import ParseError
 
 import requests
 
-from datetime import datetime
-from PIL import ImageFont, Image, ImageDraw
+from PIL import ImageFont
 
 from trains import loadDeparturesForStation, loadDeparturesForDestination, loadArrivalsAtDestination
+from board import normalisePlatform
 from config import loadConfig
-from open import isRun
+from open import isRun, secondsUntil, nextTimeAt
+from fetcher import BoardFetcher
+from boardcache import BoardCache, CircuitBreaker, OPEN
+from boardstore import BoardStore
+from fleet import FleetPublisher, FleetSubscriber, FleetUnavailable
+from scheduler import RefreshScheduler
+from metrics import MetricsRegistry, MetricsServer, addHook, timed
+from ldbws import LDBWSClient, LDBWS_URL
+from bitmapcache import BitmapCache
+from glyphatlas import getAtlas
+from widgets import Clock, StationScroller, Slot
+from display import BoardViewport
+from compositor import ArrayViewport, numpyAvailable
+from screens import ScreenManager
 
-from luma.core.interface.serial import spi, noop
-from luma.core.render import canvas
-from luma.oled.device import ssd1322
-from luma.core.virtual import viewport, snapshot
 from luma.core.sprite_system import framerate_regulator
 
 import socket, re, uuid
@@ -29,151 +40,66 @@ def makeFont(name, size):
     return ImageFont.truetype(font_path, size, layout_engine=ImageFont.Layout.BASIC)
 
 
-def renderDestination(departure, font, pos):
-    
-    # TODO: This enables renderArrivals without differentiating
-    # That's not really correct
-    if "aimed_departure_time" in departure:
-        departureTime = departure["aimed_departure_time"]
-    elif "aimed_arrival_time" in departure:
-        departureTime = departure["aimed_arrival_time"]
-    destinationName = departure["destination_name"]
-
-    def drawText(draw, *_):
-        if config["showDepartureNumbers"]:
-            train = f"{pos}  {departureTime}  {destinationName}"
-        else:
-            train = f"{departureTime}  {destinationName}"
-        _, _, bitmap = cachedBitmapText(train, font)
-        draw.bitmap((0, 0), bitmap, fill="yellow")
-
-    return drawText
+def destinationText(departure, pos):
+    if config["showDepartureNumbers"]:
+        return f"{pos}  {departure.aimed_time}  {departure.destination_name}"
+    return f"{departure.aimed_time}  {departure.destination_name}"
 
 
-def renderServiceStatus(departure):
+def renderText(text, textFont, align="left"):
     def drawText(draw, width, *_):
-        train = ""
-
-        if "expected_arrival_time" in departure:
-            # The board is an arrival board
-            expected = departure["expected_arrival_time"]
-        else:
-            # The board is a departure board
-            expected = departure["expected_departure_time"]
-
-        if expected == "On time":
-            train = "On time"
-        elif expected == "Cancelled":
-            train = "Cancelled"
-        elif expected == "Delayed":
-            train = "Delayed"
+        if not text:
+            return
+        w, _, bitmap = cachedBitmapText(text, textFont)
+        if align == "right":
+            x = width - w
+        elif align == "centre":
+            x = int((width - int(textFont.getlength(text))) / 2)
         else:
-            if isinstance(expected, str):
-                train = 'Exp ' + expected
-
-            if "expected_departure_time" in departure and departure["aimed_departure_time"] == expected:
-                train = "On time"  # departure board
-            elif "expected_arrival_time" in departure and departure["aimed_arrival_time"] == expected:
-                train = "On time"  # arrival board
+            x = 0
+        draw.bitmap((x, 0), bitmap, fill="yellow")
 
-        w, _, bitmap = cachedBitmapText(train, font)
-        draw.bitmap((width - w, 0), bitmap, fill="yellow")
     return drawText
 
 
-def renderPlatform(departure):
-    def drawText(draw, *_):
-        if "platform" in departure:
-            platform = "Plat " + departure["platform"]
-            if departure["platform"].lower() == "bus":
-                platform = "BUS"
-            _, _, bitmap = cachedBitmapText(platform, font)
-            draw.bitmap((0, 0), bitmap, fill="yellow")
-    return drawText
-
+def serviceStatus(departure):
+    expected = departure.expected_time
 
-def renderCallingAt(draw, *_):
-    stations = "Calling at: "
-    _, _, bitmap = cachedBitmapText(stations, font)
-    draw.bitmap((0, 0), bitmap, fill="yellow")
+    if expected == "On time":
+        return "On time"
+    elif expected == "Cancelled":
+        return "Cancelled"
+    elif expected == "Delayed":
+        return "Delayed"
+    elif departure.aimed_time == expected:
+        return "On time"
+    elif isinstance(expected, str):
+        return 'Exp ' + expected
+    return ""
 
 
-bitmapRenderCache = {}
+def platformText(departure):
+    if not departure.platform:
+        return ""
+    if departure.platform.lower() == "bus":
+        return "BUS"
+    return "Plat " + departure.platform
 
 
 def cachedBitmapText(text, font):
-    # cache the bitmap representation of the stations string
-    nameTuple = font.getname()
-    fontKey = ''
-    for item in nameTuple:
-        fontKey = fontKey + item
-    key = text + fontKey
-    if key in bitmapRenderCache:
-        # found in cache; re-use it
-        pre = bitmapRenderCache[key]
-        bitmap = pre['bitmap']
-        txt_width = pre['txt_width']
-        txt_height = pre['txt_height']
-    else:
-        # not cached; create a new image containing the string as a monochrome bitmap
-        _, _, txt_width, txt_height = font.getbbox(text)
-        bitmap = Image.new('L', [txt_width, txt_height], color=0)
-        pre_render_draw = ImageDraw.Draw(bitmap)
-        pre_render_draw.text((0, 0), text=text, font=font, fill=255)
-        # save to render cache
-        bitmapRenderCache[key] = {'bitmap': bitmap, 'txt_width': txt_width, 'txt_height': txt_height}
-    return txt_width, txt_height, bitmap
-
-
-pixelsLeft = 1
-pixelsUp = 0
-hasElevated = 0
-pauseCount = 0
-
-
-def renderStations(stations):
-    def drawText(draw, *_):
-        global stationRenderCount, pauseCount, pixelsLeft, pixelsUp, hasElevated
-
-        if len(stations) == stationRenderCount - 5:
-            stationRenderCount = 0
-
-        txt_width, txt_height, bitmap = cachedBitmapText(stations, font)
-
-        if hasElevated:
-            # slide the bitmap left until it's fully out of view
-            draw.bitmap((pixelsLeft - 1, 0), bitmap, fill="yellow")
-            if -pixelsLeft > txt_width and pauseCount < 8:
-                pauseCount += 1
-                pixelsLeft = 0
-                hasElevated = 0
-            else:
-                pauseCount = 0
-                pixelsLeft = pixelsLeft - 1
-        else:
-            # slide the bitmap up from the bottom of its viewport until it's fully in view
-            draw.bitmap((0, txt_height - pixelsUp), bitmap, fill="yellow")
-            if pixelsUp == txt_height:
-                pauseCount += 1
-                if pauseCount > 20:
-                    hasElevated = 1
-                    pixelsUp = 0
-            else:
-                pixelsUp = pixelsUp + 1
+    # cache the bitmap representation of the stations string; fonts are only
+    # created once at startup so the font object itself identifies the face
+    key = (text, font)
+    pre = bitmapRenderCache.get(key)
+    if pre is None:
+        # not cached; compose a monochrome bitmap of the string from the font's glyph atlas
+        with timed("text_render"):
+            txt_width, txt_height, bitmap = getAtlas(font).render(text)
+        # save to render cache, 'L' images use a byte per pixel
+        pre = (txt_width, txt_height, bitmap)
+        bitmapRenderCache.put(key, pre, txt_width * txt_height)
+    return pre
 
-    return drawText
-
-
-def renderTime(draw, width, *_):
-    rawTime = datetime.now().time()
-    hour, minute, second = str(rawTime).split('.')[0].split(':')
-
-    w1, _, HMBitmap = cachedBitmapText("{}:{}".format(hour, minute), fontBoldLarge)
-    w2, _, _ = cachedBitmapText(':00', fontBoldTall)
-    _, _, SBitmap = cachedBitmapText(':{}'.format(second), fontBoldTall)
-
-    draw.bitmap(((width - w1 - w2) / 2, 0), HMBitmap, fill="yellow")
-    draw.bitmap((((width - w1 - w2) / 2) + w1, 5), SBitmap, fill="yellow")
 
 def renderDebugScreen(lines):
     def drawDebug(draw, *_):
@@ -198,50 +124,6 @@ def renderDebugScreen(lines):
 
     return drawDebug
 
-def renderWelcomeTo(xOffset):
-    def drawText(draw, *_):
-        text = "Welcome to"
-        draw.text((int(xOffset), 0), text=text, font=fontBold, fill="yellow")
-
-    return drawText
-
-
-def renderPoweredBy(xOffset):
-    def drawText(draw, *_):
-        text = "Powered by"
-        draw.text((int(xOffset), 0), text=text, font=fontBold, fill="yellow")
-
-    return drawText
-
-
-def renderNRE(xOffset):
-    def drawText(draw, *_):
-        text = "National Rail Enquiries"
-        draw.text((int(xOffset), 0), text=text, font=fontBold, fill="yellow")
-
-    return drawText
-
-
-def renderName(xOffset):
-    def drawText(draw, *_):
-        text = "UK Train Departure Display"
-        draw.text((int(xOffset), 0), text=text, font=fontBold, fill="yellow")
-
-    return drawText
-
-
-def renderDepartureStation(departureStation, xOffset):
-    def draw(draw, *_):
-        text = departureStation
-        draw.text((int(xOffset), 0), text=text, font=fontBold, fill="yellow")
-
-    return draw
-
-
-def renderDots(draw, *_):
-    text = ".  .  ."
-    draw.text((0, 0), text=text, font=fontBold, fill="yellow")
-
 
 def loadData(apiConfig, journeyConfig, config):
     runHours = []
@@ -251,6 +133,10 @@ def loadData(apiConfig, journeyConfig, config):
     if len(runHours) == 2 and isRun(runHours[0], runHours[1]) is False:
         return False, False, journeyConfig['outOfHoursName']
 
+    if not apiBreaker.allow():
+        print(f"OpenLDBWS is failing, next try in {apiBreaker.retryIn():.0f}s")
+        return staleBoard(journeyConfig['outOfHoursName'])
+
     # set rows to 10 (max allowed) to get as many departure as poss
     # leaving as a variable so this can be updated if the API does
     rows = "10"
@@ -264,62 +150,80 @@ def loadData(apiConfig, journeyConfig, config):
             debug_flag = bool(config['debug'])
             print("using loadArrivalsAtDestination")
             departures, stationName = loadArrivalsAtDestination(
-                journeyConfig, apiConfig["apiKey"], rows, debug=debug_flag)
+                journeyConfig, apiConfig["apiKey"], rows, debug=debug_flag, client=ldbwsClient)
         elif journeyConfig["callingAtStation"] != "":
             debug_flag = bool(config['debug'])
             print("using loadDeparturesForDestination")
             departures, stationName = loadDeparturesForDestination(
-                journeyConfig, apiConfig["apiKey"], rows, debug=debug_flag)
+                journeyConfig, apiConfig["apiKey"], rows, debug=debug_flag, client=ldbwsClient)
         else:
             print("loadDeparturesForStation")
             departures, stationName = loadDeparturesForStation(
-             journeyConfig, apiConfig["apiKey"], rows)
+             journeyConfig, apiConfig["apiKey"], rows, client=ldbwsClient)
 
+        if departures is None and stationName is None:
+            # a soap:Fault, which doesn't tell us the station name either
+            print("Error: OpenLDBWS returned a fault")
+            apiBreaker.failure()
+            return staleBoard(journeyConfig['outOfHoursName'])
+
+        # anything else is a real answer, even a board with no trains on it
+        apiBreaker.success()
         if departures is None:
-            print("No response or no trains returned from API")
-            return False, False, stationName
-        
-        if isinstance(departures, list) and len(departures) == 0:
+            print("No trains returned from API")
+            board = False, False, stationName
+        elif isinstance(departures, list) and len(departures) == 0:
             print("No trains left after filter - are callingAtStation and destinationStation valid?")
-            return False, False, stationName
-        
-        if "calling_at_list" not in departures[0]:
+            board = False, False, stationName
+        elif not departures[0].calling_at_list:
             print("No calling list in first departure")
-
-            return False, False, stationName
-        firstDepartureDestinations = departures[0]["calling_at_list"]
-        return departures, firstDepartureDestinations, stationName
+            board = False, False, stationName
+        else:
+            board = departures, departures[0].calling_at_list, stationName
+        boardCache.store(board)
+        return board
     except requests.RequestException as err:
         print("Error: Failed to fetch data from OpenLDBWS")
         print(err.__context__)
-        return False, False, journeyConfig['outOfHoursName']
-
-
-def drawStartup(device, width, height):
-    virtualViewport = viewport(device, width=width, height=height)
-
-    with canvas(device):
-        nameSize = int(fontBold.getlength("UK Train Departure Display"))
-        poweredSize = int(fontBold.getlength("Powered by"))
-        NRESize = int(fontBold.getlength("National Rail Enquiries"))
-
-        rowOne = snapshot(width, 10, renderName((width - nameSize) / 2), interval=10)
-        rowThree = snapshot(width, 10, renderPoweredBy((width - poweredSize) / 2), interval=10)
-        rowFour = snapshot(width, 10, renderNRE((width - NRESize) / 2), interval=10)
-
-        if len(virtualViewport._hotspots) > 0:
-            for hotspot, xy in virtualViewport._hotspots:
-                virtualViewport.remove_hotspot(hotspot, xy)
-
-        virtualViewport.add_hotspot(rowOne, (0, 0))
-        virtualViewport.add_hotspot(rowThree, (0, 24))
-        virtualViewport.add_hotspot(rowFour, (0, 36))
-
-    return virtualViewport
+        apiBreaker.failure()
+        return staleBoard(journeyConfig['outOfHoursName'])
+    except ParseError as err:
+        # an empty or cut short response, as bad as no response at all
+        print(f"Error: Failed to read the response from OpenLDBWS: {err}")
+        apiBreaker.failure()
+        return staleBoard(journeyConfig['outOfHoursName'])
+
+
+def staleBoard(stationName):
+    """ The last good board, less the services that have left since, in place
+    of one that couldn't be fetched. A blank board if it's too old. """
+    board = boardCache.stale()
+    if board is None:
+        return False, False, stationName
+    print(f"Showing the board fetched {boardCache.age():.0f}s ago")
+    return board
+
+
+def makeViewport(device, width, height):
+    if useArrayCompositor:
+        return ArrayViewport(device, width=width, height=height)
+    return BoardViewport(device, width=width, height=height)
+
+
+def platform_filter(data, platformNumber):
+    """ The board for a screen showing one platform, looked up in the index
+    the fetcher built rather than by scanning the departures """
+    departures, firstDepartureDestinations, station = data[:3]
+    if platformNumber == "" or platformNumber == "-":
+        return departures, firstDepartureDestinations, station
+
+    platformDepartures = data.platforms.get(normalisePlatform(platformNumber), ())
+    if len(platformDepartures) > 0:
+        return platformDepartures, platformDepartures[0].calling_at_list, station
+    return platformDepartures, "", station
 
-def drawDebugScreen(device, width, height, screen="1", showTime=False):
-    virtualViewport = viewport(device, width=width, height=height)
 
+def debugScreenLines(platform):
     versionNumber = getVersionNumber().strip()
     
     ipAddress = getIp()
@@ -339,8 +243,8 @@ def drawDebugScreen(device, width, height, screen="1", showTime=False):
         debugLines["1B"] += f"->{config['journey']['destinationStation']}"
 
     # what about a plaform?
-    if(config["journey"]["screen"+screen+"Platform"]):
-        debugLines["1B"] += f" (Plat{config['journey']['screen'+screen+'Platform']}) "
+    if(platform):
+        debugLines["1B"] += f" (Plat{platform}) "
     else:
         debugLines["1B"] += " (PlatAll) "
 
@@ -358,146 +262,188 @@ def drawDebugScreen(device, width, height, screen="1", showTime=False):
     debugLines["3B"] = f"= {macAddress}"
     debugLines["3C"] = f"IP={ipAddress}"
 
-    theBox = snapshot(width, 64, renderDebugScreen(debugLines), interval=config["refreshTime"])
-    virtualViewport.add_hotspot(theBox, (0, 0))
-
-    if(showTime):
-        rowTime = snapshot(width, 14, renderTime, interval=0.1)
-        virtualViewport.add_hotspot(rowTime, (0, 50))
-
-    return virtualViewport
-
-
-
-
-def drawBlankSignage(device, width, height, departureStation):
-    global stationRenderCount, pauseCount
-
-    welcomeSize = int(fontBold.getlength("Welcome to"))
-    stationSize = int(fontBold.getlength(departureStation))
-
-    device.clear()
-
-    virtualViewport = viewport(device, width=width, height=height)
-
-    rowOne = snapshot(width, 10, renderWelcomeTo(
-        (width - welcomeSize) / 2), interval=config["refreshTime"])
-    rowTwo = snapshot(width, 10, renderDepartureStation(
-        departureStation, (width - stationSize) / 2), interval=config["refreshTime"])
-    rowThree = snapshot(width, 10, renderDots, interval=config["refreshTime"])
-    # this will skip a second sometimes if set to 1, but a hotspot burns CPU
-    # so set to snapshot of 0.1; you won't notice
-    rowTime = snapshot(width, 14, renderTime, interval=0.1)
-
-    if len(virtualViewport._hotspots) > 0:
-        for vhotspot, xy in virtualViewport._hotspots:
-            virtualViewport.remove_hotspot(vhotspot, xy)
-
-    virtualViewport.add_hotspot(rowOne, (0, 0))
-    virtualViewport.add_hotspot(rowTwo, (0, 12))
-    virtualViewport.add_hotspot(rowThree, (0, 24))
-    virtualViewport.add_hotspot(rowTime, (0, 50))
-
-    return virtualViewport
-
-
-def platform_filter(departureData, platformNumber, station):
-    platformDepartures = []
-    for sub in departureData:
-        if platformNumber == "" or platformNumber == "-":
-            platformDepartures.append(sub)
-        elif sub.get('platform') is not None:
-            if sub['platform'] == platformNumber:
-                res = sub
-                platformDepartures.append(res)
-
-    if len(platformDepartures) > 0:
-        firstDepartureDestinations = platformDepartures[0]["calling_at_list"]
-        platformData = platformDepartures, firstDepartureDestinations, station
-    else:
-        platformData = platformDepartures, "", station
-
-    return platformData
-
-
-def drawSignage(device, width, height, data):
-    global stationRenderCount, pauseCount
-
-    virtualViewport = viewport(device, width=width, height=height)
-
-    status = "Exp 00:00"
-    callingAt = "Calling at: "
-
-    departures, firstDepartureDestinations, departureStation = data
-
-    w = int(font.getlength(callingAt))
-
-    callingWidth = w
-    width = virtualViewport.width
-
-    # First measure the text size
-    w = int(font.getlength(status))
-    pw = int(font.getlength("Plat 88"))
-
-    if len(departures) == 0:
-        noTrains = drawBlankSignage(device, width=width, height=height, departureStation=departureStation)
-        return noTrains
-
-    firstFont = font
-    if config['firstDepartureBold']:
-        firstFont = fontBold
-
-    rowOneA = snapshot(
-        width - w - pw - 5, 10, renderDestination(departures[0], firstFont, '1st'), interval=config["refreshTime"])
-    rowOneB = snapshot(w, 10, renderServiceStatus(
-        departures[0]), interval=10)
-    rowOneC = snapshot(pw, 10, renderPlatform(departures[0]), interval=config["refreshTime"])
-    rowTwoA = snapshot(callingWidth, 10, renderCallingAt, interval=config["refreshTime"])
-    rowTwoB = snapshot(width - callingWidth, 10,
-                       renderStations(firstDepartureDestinations), interval=0.02)
-
-    if len(departures) > 1:
-        rowThreeA = snapshot(width - w - pw, 10, renderDestination(
-            departures[1], font, '2nd'), interval=config["refreshTime"])
-        rowThreeB = snapshot(w, 10, renderServiceStatus(
-            departures[1]), interval=config["refreshTime"])
-        rowThreeC = snapshot(pw, 10, renderPlatform(departures[1]), interval=config["refreshTime"])
-
-    if len(departures) > 2:
-        rowFourA = snapshot(width - w - pw, 10, renderDestination(
-            departures[2], font, '3rd'), interval=10)
-        rowFourB = snapshot(w, 10, renderServiceStatus(
-            departures[2]), interval=10)
-        rowFourC = snapshot(pw, 10, renderPlatform(departures[2]), interval=config["refreshTime"])
-
-    rowTime = snapshot(width, 14, renderTime, interval=0.1)
-
-    if len(virtualViewport._hotspots) > 0:
-        for vhotspot, xy in virtualViewport._hotspots:
-            virtualViewport.remove_hotspot(vhotspot, xy)
-
-    stationRenderCount = 0
-    pauseCount = 0
-
-    virtualViewport.add_hotspot(rowOneA, (0, 0))
-    virtualViewport.add_hotspot(rowOneB, (width - w, 0))
-    virtualViewport.add_hotspot(rowOneC, (width - w - pw, 0))
-    virtualViewport.add_hotspot(rowTwoA, (0, 12))
-    virtualViewport.add_hotspot(rowTwoB, (callingWidth, 12))
-
-    if len(departures) > 1:
-        virtualViewport.add_hotspot(rowThreeA, (0, 24))
-        virtualViewport.add_hotspot(rowThreeB, (width - w, 24))
-        virtualViewport.add_hotspot(rowThreeC, (width - w - pw, 24))
-
-    if len(departures) > 2:
-        virtualViewport.add_hotspot(rowFourA, (0, 36))
-        virtualViewport.add_hotspot(rowFourB, (width - w, 36))
-        virtualViewport.add_hotspot(rowFourC, (width - w - pw, 36))
-
-    virtualViewport.add_hotspot(rowTime, (0, 50))
+    return debugLines
+
+
+class BoardLayout:
+    """ Everything drawn on one screen. The viewport, and the hotspots of each
+    kind of screen (startup, debug, blank, departures), are made the first time
+    they are needed and then kept; showing new data only rebinds what the slots
+    draw, so just the slots whose content changed are redrawn. """
+
+    def __init__(self, device, width, height):
+        self.device = device
+        self.viewport = makeViewport(device, width=width, height=height)
+        self.width = self.viewport.width
+        # the fonts never change, so neither do the column widths
+        self.statusWidth = int(font.getlength("Exp 00:00"))
+        self.platformWidth = int(font.getlength("Plat 88"))
+        self.callingWidth = int(font.getlength("Calling at: "))
+        self.screens = {}
+        self.screen = None
+        self.stationsText = None
+
+    def use(self, name, build):
+        """ Put the hotspots of the named screen on the viewport, building them
+        if this is the first time it has been shown """
+        if self.screen == name:
+            return self.screens[name]
+
+        viewport = self.viewport
+        if self.screen is not None:
+            for hotspot, xy in self.screens[self.screen].values():
+                viewport.remove_hotspot(hotspot, xy)
+
+        if name not in self.screens:
+            self.screens[name] = build()
+        for hotspot, xy in self.screens[name].values():
+            hotspot.invalidate()
+            viewport.add_hotspot(hotspot, xy)
+
+        # everything on the panel changes, so send it as one frame
+        viewport.fullFrame = True
+        self.screen = name
+        return self.screens[name]
+
+    def invalidate(self):
+        # the panel was cleared behind the viewport's back, send it all again
+        self.viewport.fullFrame = True
+
+    def refresh(self):
+        self.viewport.refresh()
+
+    def boardTexts(self):
+        """ (text, font) of everything drawn on the departures screen, so the
+        bitmaps for them can be saved along with the board """
+        if "board" not in self.screens:
+            return []
+        texts = [(self.stationsText, font)]
+        for slot, _ in self.screens["board"].values():
+            key = getattr(slot, "key", None)
+            if isinstance(key, tuple) and len(key) == 3 and isinstance(key[0], str):
+                texts.append(key[:2])
+        return texts
+
+    def bindText(self, slot, text, textFont, align="left"):
+        key = (text, textFont, align)
+        if slot.key != key:
+            slot.bind(key, renderText(text, textFont, align))
+
+    def textSlots(self, *rows):
+        return {name: (Slot(self.width, 10), (0, y)) for name, y in rows}
+
+    def showStartup(self):
+        slots = self.use("startup", lambda: self.textSlots(("name", 0), ("poweredBy", 24), ("nre", 36)))
+        self.bindText(slots["name"][0], "UK Train Departure Display", fontBold, "centre")
+        self.bindText(slots["poweredBy"][0], "Powered by", fontBold, "centre")
+        self.bindText(slots["nre"][0], "National Rail Enquiries", fontBold, "centre")
+
+    def buildDebug(self, showTime):
+        slots = {"box": (Slot(self.width, 50), (0, 0))}
+        if showTime:
+            slots["clock"] = (Clock(self.width, 14, fontBoldLarge, fontBoldTall), (0, 50))
+        return slots
+
+    def showDebug(self, lines, showTime=False):
+        slots = self.use("debugClock" if showTime else "debug", lambda: self.buildDebug(showTime))
+        box = slots["box"][0]
+        key = tuple(lines.items())
+        if box.key != key:
+            box.bind(key, renderDebugScreen(lines))
+
+    def buildBlank(self):
+        slots = self.textSlots(("welcome", 0), ("station", 12), ("dots", 24))
+        # the clock only redraws when the second changes
+        slots["clock"] = (Clock(self.width, 14, fontBoldLarge, fontBoldTall), (0, 50))
+        return slots
+
+    def showBlank(self, departureStation):
+        slots = self.use("blank", self.buildBlank)
+        self.bindText(slots["welcome"][0], "Welcome to", fontBold, "centre")
+        self.bindText(slots["station"][0], departureStation, fontBold, "centre")
+        self.bindText(slots["dots"][0], ".  .  .", fontBold)
+
+    def buildBoard(self, stations):
+        width = self.width
+        w = self.statusWidth
+        pw = self.platformWidth
+        slots = {
+            "callingAt": (Slot(self.callingWidth, 10), (0, 12)),
+            "stations": (StationScroller(width - self.callingWidth, 10, stations,
+                                         config["scrollSpeed"], config["scrollPause"]), (self.callingWidth, 12)),
+            "clock": (Clock(width, 14, fontBoldLarge, fontBoldTall), (0, 50))
+        }
+        for row, (y, destinationWidth) in enumerate(((0, width - w - pw - 5), (24, width - w - pw), (36, width - w - pw))):
+            slots[f"destination{row}"] = (Slot(destinationWidth, 10), (0, y))
+            slots[f"status{row}"] = (Slot(w, 10), (width - w, y))
+            slots[f"platform{row}"] = (Slot(pw, 10), (width - w - pw, y))
+        return slots
+
+    def showBoard(self, data):
+        departures, firstDepartureDestinations, departureStation = data
+
+        if len(departures) == 0:
+            self.showBlank(departureStation)
+            return
+
+        stations = cachedBitmapText(firstDepartureDestinations, font)
+        slots = self.use("board", lambda: self.buildBoard(stations))
+        self.bindText(slots["callingAt"][0], "Calling at: ", font)
+
+        # only restart the calling points scroll if they have actually changed
+        if self.stationsText != firstDepartureDestinations:
+            slots["stations"][0].setText(stations)
+            self.stationsText = firstDepartureDestinations
+
+        firstFont = font
+        if config['firstDepartureBold']:
+            firstFont = fontBold
+
+        for row, pos in enumerate(('1st', '2nd', '3rd')):
+            destination = slots[f"destination{row}"][0]
+            status = slots[f"status{row}"][0]
+            platform = slots[f"platform{row}"][0]
+            if row < len(departures):
+                departure = departures[row]
+                self.bindText(destination, destinationText(departure, pos), firstFont if row == 0 else font)
+                self.bindText(status, serviceStatus(departure), font, "right")
+                self.bindText(platform, platformText(departure), font)
+            else:
+                # painting an empty slot clears what the last board left there
+                destination.clear()
+                status.clear()
+                platform.clear()
+
+
+def warmStart():
+    """ Loads the board and text bitmaps saved before the last restart into the
+    caches, and returns the board less the services that have left since, or
+    None if there's nothing recent enough to show """
+    if boardStore is None:
+        return None
+    saved = boardStore.load()
+    if saved is None:
+        return None
+    board, fetchedAt, bitmaps = saved
+    for key, pre in bitmaps:
+        bitmapRenderCache.put(key, pre, pre[0] * pre[1])
+    boardCache.store(board, fetchedAt)
+    board = boardCache.stale()
+    if board is not None:
+        print(f"Showing the board saved {boardCache.age():.0f}s ago until the first fetch")
+    return board
+
+
+def saveBoard(screens):
+    # only the bitmaps on the screens now, not everything in the cache
+    bitmaps = []
+    for screen in screens:
+        for key in screen.layout.boardTexts():
+            pre = bitmapRenderCache.peek(key)
+            if pre is not None:
+                bitmaps.append((key, pre))
+    boardStore.saveInBackground(boardCache.board, boardCache.fetchedAt, bitmaps)
 
-    return virtualViewport
 
 def getIp():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -516,107 +462,269 @@ def getVersionNumber():
     version_file = open('VERSION', 'r')
     return version_file.read()
 
-try:
-    print('Starting Train Departure Display v' + getVersionNumber())
-    config = loadConfig()
-    if config['headless']:
-        print('Headless mode, running main loop without serial comms')
-        serial = noop()
-    else:
-        serial = spi(port=0)
-    device = ssd1322(serial, mode="1", rotate=config['screenRotation'])
-
-    if config['dualScreen']:
-        serial1 = spi(port=1, gpio_DC=5, gpio_RST=6)
-        device1 = ssd1322(serial1, mode="1", rotate=config['screenRotation'])
+def setup(loadedConfig):
+    """ Create what the drawing and fetching functions above share: the config,
+    the API client, the fonts and the text bitmap cache. main() calls this, as
+    does anything importing this module to use those functions on their own """
+    global config, ldbwsClient, boardCache, apiBreaker, boardStore, useArrayCompositor, font, fontBold, fontBoldTall, fontBoldLarge, bitmapRenderCache
+    config = loadedConfig
+    ldbwsClient = LDBWSClient(
+        url=config["api"]["url"] or LDBWS_URL,
+        connectTimeout=config["api"]["connectTimeout"],
+        readTimeout=config["api"]["readTimeout"],
+        retries=config["api"]["retries"])
+    boardCache = BoardCache(config["api"]["staleMaxAge"])
+    apiBreaker = CircuitBreaker(config["api"]["failureThreshold"], config["api"]["backoffTime"],
+                                config["api"]["backoffMaxTime"])
+    useArrayCompositor = config["compositor"] == "numpy" and numpyAvailable()
+    if config["compositor"] == "numpy" and not useArrayCompositor:
+        print("Warning: NumPy is not installed, using the PIL compositor")
     font = makeFont("Dot Matrix Regular.ttf", 10)
     fontBold = makeFont("Dot Matrix Bold.ttf", 10)
     fontBoldTall = makeFont("Dot Matrix Bold Tall.ttf", 10)
     fontBoldLarge = makeFont("Dot Matrix Bold.ttf", 20)
+    bitmapRenderCache = BitmapCache(config["bitmapCacheKB"] * 1024)
+    boardStore = None
+    if config["boardCacheFile"]:
+        boardStore = BoardStore(config["boardCacheFile"], {
+            "font": font, "fontBold": fontBold, "fontBoldTall": fontBoldTall, "fontBoldLarge": fontBoldLarge})
+    # rasterise the glyphs of every font up front, text is composed from these
+    for eachFont in (font, fontBold, fontBoldTall, fontBoldLarge):
+        getAtlas(eachFont)
 
-    widgetWidth = 256
-    widgetHeight = 64
-
-    stationRenderCount = 0
-    pauseCount = 0
-    loop_count = 0
 
-    regulator = framerate_regulator(config['targetFPS'])
-
-    if (config['debug'] > 1):
-        # render screen and sleep for specified seconds
-        virtual = drawDebugScreen(device, width=widgetWidth, height=widgetHeight)
-        virtual.refresh()
-        if config['dualScreen']:
-            virtual = drawDebugScreen(device, width=widgetWidth, height=widgetHeight, screen="2")
-            virtual.refresh()
-        time.sleep(config['debug'])
-    else:
-        # display NRE attribution while data loads
-        virtual = drawStartup(device, width=widgetWidth, height=widgetHeight)
-        virtual.refresh()
-        if config['dualScreen']:
-            virtual = drawStartup(device1, width=widgetWidth, height=widgetHeight)
-            virtual.refresh()
-        if config['headless'] is not True:
-            time.sleep(5)
-
-    timeAtStart = time.time() - config["refreshTime"]
-    timeNow = time.time()
-    timeFPS = time.time()
-
-    blankHours = []
-    if config['hoursPattern'].match(config['screenBlankHours']):
-        blankHours = [int(x) for x in config['screenBlankHours'].split('-')]
-
-    while True:
-        with regulator:
-            if len(blankHours) == 2 and isRun(blankHours[0], blankHours[1]):
-                device.clear()
-                if config['dualScreen']:
-                    device1.clear()
-                time.sleep(10)
-            else:
+def main():
+    try:
+        print('Starting Train Departure Display v' + getVersionNumber())
+        loadedConfig = loadConfig()
+        if loadedConfig['headless']:
+            print('Headless mode, running main loop without serial comms')
+        setup(loadedConfig)
+
+        widgetWidth = 256
+        widgetHeight = 64
+
+        loop_count = 0
+
+        regulator = framerate_regulator(config['targetFPS'])
+
+        # one layout per screen, kept for as long as the display runs; with more
+        # than one screen each is refreshed on its own thread, in step
+        screens = ScreenManager(
+            config["screens"],
+            lambda device: BoardLayout(device, width=widgetWidth, height=widgetHeight),
+            headless=config['headless'])
+
+        # the board from before a restart, shown until the first fetch is done
+        warmBoard = warmStart() if config["debug"] != True else None
+        savedBoards = boardCache.stored
+        saveAfterFrame = False
+
+        if (config['debug'] > 1):
+            # render screen and sleep for specified seconds
+            for screen in screens:
+                screen.layout.showDebug(debugScreenLines(screen.platform))
+            screens.refresh()
+            time.sleep(config['debug'])
+        elif warmBoard is None:
+            # display NRE attribution while data loads
+            for screen in screens:
+                screen.layout.showStartup()
+            screens.refresh()
+            if config['headless'] is not True:
+                time.sleep(5)
+
+        timeAtStart = time.time() - config["refreshTime"]
+        timeNow = time.time()
+        timeFPS = time.time()
+
+        blankHours = []
+        if config['hoursPattern'].match(config['screenBlankHours']):
+            blankHours = [int(x) for x in config['screenBlankHours'].split('-')]
+
+        def isBlankHours():
+            return len(blankHours) == 2 and isRun(blankHours[0], blankHours[1])
+
+        def nextBlankStart():
+            if len(blankHours) != 2:
+                return None
+            if isBlankHours():
+                return time.time()
+            return time.time() + secondsUntil(blankHours[0])
+
+        prewarm = threading.Event()
+
+        def sleepThroughBlankHours():
+            # work out when to wake once, then turn the panels off and sleep
+            # right through rather than polling the clock
+            wakeAt = nextTimeAt(blankHours[1]).timestamp()
+            print(time.strftime('Screens off until %H:%M', time.localtime(wakeAt)))
+            screens.hide()
+            time.sleep(max(0, wakeAt - config["blankPrewarm"] - time.time()))
+
+            # fetch the board a little early so the first frame is up to date
+            prewarm.set()
+            fetcher.refreshNow()
+            time.sleep(max(0, wakeAt - time.time()))
+            prewarm.clear()
+            screens.invalidate()
+
+        publisher = subscriber = None
+        if config["fleetMode"] == "publisher":
+            publisher = FleetPublisher("0.0.0.0", config["fleetPort"])
+            publisher.start()
+            print(f"Publishing the board to the fleet on port {config['fleetPort']}")
+        elif config["fleetMode"] == "subscriber":
+            subscriber = FleetSubscriber(config["fleetPublisher"])
+            print(f"Taking the board from {config['fleetPublisher']}")
+
+        def fetchBoard():
+            # no point calling the API while the screens are blanked, other than
+            # to have the board ready for when they wake
+            if isBlankHours() and not prewarm.is_set():
+                return None
+
+            if subscriber is not None and subscriber.breaker.allow():
+                try:
+                    received = subscriber.poll()
+                except FleetUnavailable as err:
+                    print(f"Error: Fleet publisher unavailable, fetching directly: {err}")
+                else:
+                    if received is None:
+                        return None
+                    board, fetchedAt = received
+                    boardCache.store(board, fetchedAt)
+                    return received
+                if config["api"]["apiKey"] is None:
+                    # nothing to fetch with, wait for the publisher to come back
+                    return None
+
+            board = loadData(config["api"], config["journey"], config)
+            # a stale board keeps the time it was really fetched
+            fetchedAt = boardCache.fetchedAt or time.time()
+            if publisher is not None:
+                publisher.publish(board, fetchedAt)
+            return board, fetchedAt
+
+        refreshInterval = config["refreshTime"]
+        if config["adaptiveRefresh"]:
+            operatingHours = None
+            if config['hoursPattern'].match(config['api']['operatingHours']):
+                operatingHours = [int(x) for x in config['api']['operatingHours'].split('-')]
+            refreshInterval = RefreshScheduler(
+                config["refreshMinTime"], config["refreshMaxTime"], config["refreshTime"],
+                operatingHours=operatingHours).nextInterval
+
+        def nextFetch(snapshot):
+            if isBlankHours() and not prewarm.is_set():
+                # sleep with the screens until it's time to fetch for waking
+                wakeAt = nextTimeAt(blankHours[1]).timestamp()
+                return max(1, wakeAt - config["blankPrewarm"] - time.time())
+            if subscriber is not None and subscriber.live and not isBlankHours():
+                # the publisher holds each poll until there's a new board
+                return 0
+            interval = refreshInterval(snapshot) if callable(refreshInterval) else refreshInterval
+            # after a failure try again sooner, unless the breaker says to hold off
+            retryIn = apiBreaker.retryIn()
+            if apiBreaker.state == OPEN:
+                return retryIn
+            if retryIn is not None:
+                return min(interval, retryIn)
+            return interval
+
+        # the fetcher does the network request and parsing on its own thread; the
+        # render loop below only swaps to a new board between frames
+        fetcher = BoardFetcher(fetchBoard, nextFetch)
+        if warmBoard is not None:
+            fetcher.publish(warmBoard, boardCache.fetchedAt)
+
+        if config["metricsPort"]:
+            registry = MetricsRegistry()
+            addHook(registry)
+            registry.gauge("bitmap_cache", "Rendered text bitmap cache counters",
+                           lambda: {(("stat", stat),): value for stat, value in bitmapRenderCache.stats().items()})
+            registry.gauge("api_requests_total", "OpenLDBWS requests, retries and errors by operation",
+                           lambda: {(("operation", operation), ("result", result)): stat[result]
+                                    for operation, stat in ldbwsClient.statsSnapshot().items()
+                                    for result in ("calls", "retries", "errors")}, kind="counter")
+            registry.gauge("board_age_seconds", "Seconds since the board on the screens was fetched",
+                           lambda: time.time() - fetcher.snapshot.fetchedAt if fetcher.snapshot else None)
+            registry.gauge("api_circuit_open", "1 while OpenLDBWS calls are being held off after repeated failures",
+                           lambda: 1 if apiBreaker.state == OPEN else 0)
+            registry.gauge("boards_fetched_total", "Number of boards fetched since starting",
+                           lambda: fetcher.generation, kind="counter")
+            MetricsServer(registry, config["metricsHost"], config["metricsPort"]).start()
+            print(f"Serving metrics on http://{config['metricsHost']}:{config['metricsPort']}/metrics")
+
+        if config["debug"] != True:
+            fetcher.start()
+        shownGeneration = 0
+        wasBlank = False
+        blankAt = nextBlankStart()
+
+        while True:
+            # a float comparison per frame, the clock is only consulted when due
+            if blankAt is not None and time.time() >= blankAt:
+                if isBlankHours():
+                    sleepThroughBlankHours()
+                    wasBlank = True
+                blankAt = nextBlankStart()
+
+            with regulator:
                 if timeNow - timeFPS >= config['fpsTime']:
                     timeFPS = time.time()
-                    print('Effective FPS: ' + str(round(regulator.effective_FPS(), 2)))
-                if timeNow - timeAtStart >= config["refreshTime"]:
-                    # check if debug mode is enabled 
-                    if config["debug"] == True:
+                    framesSent, framesSkipped, pixelsSent = screens.frameStats()
+                    print('Effective FPS: ' + str(round(regulator.effective_FPS(), 2)) +
+                          f' ({framesSent} frames sent, {framesSkipped} unchanged frames skipped' +
+                          (f' over {len(screens)} screens)' if len(screens) > 1 else ')'))
+                    print('Bitmap cache: ' + bitmapRenderCache.report())
+                    if framesSent:
+                        print('SPI pixels per frame: ' + str(pixelsSent // framesSent))
+                    if ldbwsClient.stats:
+                        print('API latency: ' + ldbwsClient.latencyReport())
+                # check if debug mode is enabled
+                if config["debug"] == True:
+                    if timeNow - timeAtStart >= config["refreshTime"]:
                         print(config["debug"])
-                        virtual = drawDebugScreen(device, width=widgetWidth, height=widgetHeight, showTime=True)
-                        if config['dualScreen']:
-                            virtual1 = drawDebugScreen(device1, width=widgetWidth, height=widgetHeight, showTime=True, screen="2")
-                    else:
-                        data = loadData(config["api"], config["journey"], config)
+                        for screen in screens:
+                            screen.layout.showDebug(debugScreenLines(screen.platform), showTime=True)
+                        timeAtStart = time.time()
+                else:
+                    data = fetcher.latest()
+                    if data is not None and data.generation != shownGeneration:
+                        shownGeneration = data.generation
+                        # a board fresh from the API rather than an old one, keep
+                        # it once it's been drawn
+                        saveAfterFrame = boardStore is not None and boardCache.stored != savedBoards
                         if data[0] is False:
-                            virtual = drawBlankSignage(
-                                device, width=widgetWidth, height=widgetHeight, departureStation=data[2])
-                            if config['dualScreen']:
-                                virtual1 = drawBlankSignage(
-                                    device1, width=widgetWidth, height=widgetHeight, departureStation=data[2])
+                            for screen in screens:
+                                screen.layout.showBlank(data[2])
                         else:
-                            departureData = data[0]
-                            nextStations = data[1]
-                            station = data[2]
-                            screenData = platform_filter(departureData, config["journey"]["screen1Platform"], station)
-                            virtual = drawSignage(device, width=widgetWidth, height=widgetHeight, data=screenData)
-                            # virtual = drawDebugScreen(device, width=widgetWidth, height=widgetHeight, showTime=True)
-
-                            if config['dualScreen']:
-                                screen1Data = platform_filter(departureData, config["journey"]["screen2Platform"], station)
-                                virtual1 = drawSignage(device1, width=widgetWidth, height=widgetHeight, data=screen1Data)
-
-                    timeAtStart = time.time()
+                            print('Departures by platform: ' + (', '.join(
+                                f'{platform} ({len(platformDepartures)})'
+                                for platform, platformDepartures in data.platforms.items()) or 'none given'))
+                            for screen in screens:
+                                screenData = platform_filter(data, screen.platform)
+                                screen.layout.showBoard(screenData)
 
                 timeNow = time.time()
-                virtual.refresh()
-                if config['dualScreen']:
-                    virtual1.refresh()
-
-except KeyboardInterrupt:
-    pass
-except ValueError as err:
-    print(f"Error: {err}")
-# except KeyError as err:
-#     print(f"Error: Please ensure the {err} environment variable is set")
+                with timed("frame"):
+                    screens.refresh()
+                if saveAfterFrame:
+                    saveAfterFrame = False
+                    savedBoards = boardCache.stored
+                    saveBoard(screens)
+                if wasBlank:
+                    # the first frame after waking has been drawn, turn the panels back on
+                    wasBlank = False
+                    screens.show()
+    except KeyboardInterrupt:
+        pass
+    except ValueError as err:
+        print(f"Error: {err}")
+    # except KeyError as err:
+    #     print(f"Error: Please ensure the {err} environment variable is set")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+# callables taking (stage, seconds); timing is skipped entirely while empty
+hooks = []
+
+
+def addHook(hook):
+    hooks.append(hook)
+
+
+def observe(stage, seconds):
+    for hook in hooks:
+        hook(stage, seconds)
+
+
+class timed:
+    """ Context manager timing a stage of the pipeline into the hooks:
+
+        with timed("parse"):
+            ...
+    """
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        if hooks:
+            self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            observe(self.stage, perf_counter() - self.started)
+
+
+class StageHistogram:
+    """ The last size durations of a stage in a fixed ring buffer, plus running
+    totals. Quantiles are only worked out when someone asks for them. """
+
+    def __init__(self, size):
+        self.samples = [0.0] * size
+        self.next = 0
+        self.filled = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.samples[self.next] = seconds
+        self.next = (self.next + 1) % len(self.samples)
+        self.filled = min(self.filled + 1, len(self.samples))
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self, points):
+        ordered = sorted(self.samples[:self.filled])
+        if not ordered:
+            return [(point, float("nan")) for point in points]
+        return [(point, ordered[min(int(point * len(ordered)), len(ordered) - 1)]) for point in points]
+
+
+class MetricsRegistry:
+    """ Hook that keeps a StageHistogram per stage, and renders them along with
+    any registered gauges in the Prometheus text exposition format """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, size=1024, prefix="departure_board"):
+        self.size = size
+        self.prefix = prefix
+        self.stages = {}
+        self.gauges = []
+        self.lock = threading.Lock()
+
+    def __call__(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram(self.size)
+            histogram.record(seconds)
+
+    def gauge(self, name, help, read, kind="gauge"):
+        """ read() returns a number, or a dict of label dict -> number """
+        self.gauges.append((f"{self.prefix}_{name}", help, read, kind))
+
+    def render(self):
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of fetching and drawing the board, quantiles over the last {self.size} runs",
+            f"# TYPE {name} summary"
+        ]
+        with self.lock:
+            stages = [(stage, histogram.quantiles(self.QUANTILES), histogram.total, histogram.count)
+                      for stage, histogram in sorted(self.stages.items())]
+        for stage, quantiles, total, count in stages:
+            for point, value in quantiles:
+                lines.append(f'{name}{{stage="{stage}",quantile="{point}"}} {value:.6g}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6g}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for gaugeName, help, read, kind in self.gauges:
+            lines.append(f"# HELP {gaugeName} {help}")
+            lines.append(f"# TYPE {gaugeName} {kind}")
+            value = read()
+            if isinstance(value, dict):
+                for labels, labelledValue in value.items():
+                    labelText = ",".join(f'{label}="{text}"' for label, text in labels)
+                    lines.append(f"{gaugeName}{{{labelText}}} {labelledValue:.6g}")
+            elif value is not None:
+                lines.append(f"{gaugeName} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """ Serves a registry at /metrics from a daemon thread. Nothing is worked
+    out until a scrape arrives. """
+
+    def __init__(self, registry, host, port):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
@@ -1,4 +1,4 @@
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
 
 def is_time_between(begin_time, end_time, check_time=None):
@@ -12,3 +12,18 @@ def is_time_between(begin_time, end_time, check_time=None):
 
 def isRun(start_hour, end_hour):
     return is_time_between(time(start_hour, 0), time(end_hour, 0))
+
+
+def nextTimeAt(hour, now=None):
+    """ The next time the clock reaches hour:00, as a datetime """
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return target
+
+
+def secondsUntil(hour, now=None):
+    """ Seconds from now until the next time the clock reaches hour:00 """
+    now = now or datetime.now()
+    return (nextTimeAt(hour, now) - now).total_seconds()
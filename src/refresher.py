@@ -0,0 +1,48 @@
+import threading
+
+
+class ScreenRefresher:
+    """ Refreshes several screens at the same time, each on its own SPI port.
+    The calling thread refreshes the first screen and a worker thread each of
+    the others; a barrier either side of the frame keeps them in step, so a
+    frame takes as long as the slowest screen rather than the sum of them all,
+    and the screens are only ever changed between frames. """
+
+    def __init__(self, screens):
+        self.screens = list(screens)
+        parties = len(self.screens)
+        self.frameStart = threading.Barrier(parties)
+        self.frameEnd = threading.Barrier(parties)
+        self.errors = []
+        self.threads = [
+            threading.Thread(target=self.run, args=(screen,), name=f"ScreenRefresher-{n}", daemon=True)
+            for n, screen in enumerate(self.screens[1:], start=1)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def refresh(self):
+        if not self.threads:
+            self.screens[0].refresh()
+            return
+
+        self.frameStart.wait()
+        try:
+            self.screens[0].refresh()
+        finally:
+            self.frameEnd.wait()
+
+        # errors from the workers are raised here, as they would have been
+        # had the screens been refreshed one after the other
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def run(self, screen):
+        while True:
+            self.frameStart.wait()
+            try:
+                screen.refresh()
+            except Exception as err:
+                self.errors.append(err)
+            finally:
+                self.frameEnd.wait()
@@ -0,0 +1,53 @@
+from datetime import datetime, time
+
+from board import minutesUntil
+from open import is_time_between, secondsUntil
+
+
+class RefreshScheduler:
+    """ Works out how long to wait before the next fetch from the board just
+    fetched: soon when the first departure is about to leave or is running
+    late, longer the further away it is, and not at all outside the operating
+    hours. Intervals are kept between minInterval and maxInterval seconds. """
+
+    def __init__(self, minInterval, maxInterval, defaultInterval, operatingHours=None, imminentMinutes=5):
+        self.minInterval = minInterval
+        self.maxInterval = max(minInterval, maxInterval)
+        self.defaultInterval = defaultInterval
+        # [start hour, end hour], or None to run all day
+        self.operatingHours = operatingHours
+        self.imminentMinutes = imminentMinutes
+
+    def clamp(self, interval):
+        return int(min(self.maxInterval, max(self.minInterval, interval)))
+
+    def nextInterval(self, data, now=None):
+        interval, reason = self.decide(data, now or datetime.now())
+        print(f"Next refresh in {interval}s ({reason})")
+        return interval
+
+    def decide(self, data, now):
+        start, end = self.operatingHours or (None, None)
+        if start is not None and not is_time_between(time(start, 0), time(end, 0), now.time()):
+            # nothing is fetched out of hours, so sleep until they start
+            return int(secondsUntil(start, now)), "outside operating hours"
+
+        if data is None or data.departures is False or len(data.departures) == 0:
+            return self.maxInterval, "no departures"
+
+        first = data.departures[0]
+        if first.expected_time in ("Delayed", "Cancelled"):
+            return self.minInterval, f"first departure is {first.expected_time.lower()}"
+        if (first.expected_minutes is not None and first.aimed_minutes is not None
+                and first.expected_minutes != first.aimed_minutes):
+            return self.minInterval, f"first departure expected at {first.expected_time}"
+
+        departs = first.expected_minutes if first.expected_minutes is not None else first.aimed_minutes
+        if departs is None:
+            return self.clamp(self.defaultInterval), "first departure time unknown"
+
+        minutesAway = minutesUntil(departs, now)
+        if minutesAway <= self.imminentMinutes:
+            return self.minInterval, f"first departure in {max(minutesAway, 0)} min"
+        # check a few times before it leaves, more often the nearer it gets
+        return self.clamp(minutesAway * 60 / 3), f"first departure in {minutesAway} min"
@@ -0,0 +1,74 @@
+from luma.core.interface.serial import spi, noop
+from luma.oled.device import ssd1322
+
+from display import DamageFramebuffer
+from refresher import ScreenRefresher
+
+
+def makeDevice(definition, headless=False):
+    if headless:
+        serial = noop()
+    else:
+        serial = spi(port=definition["port"], device=definition["device"],
+                     gpio_DC=definition["gpioDC"], gpio_RST=definition["gpioRST"])
+    return ssd1322(serial, mode="1", rotate=definition["rotation"], framebuffer=DamageFramebuffer())
+
+
+class Screen:
+    """ One SSD1322 panel: its definition from the config, the luma device
+    driving it and the layout drawn on it """
+
+    def __init__(self, number, definition, device, layout):
+        self.number = number
+        self.definition = definition
+        self.platform = definition["platform"]
+        self.device = device
+        self.layout = layout
+
+
+class ScreenManager:
+    """ Drives any number of panels from a list of screen definitions (SPI
+    port and chip select, DC/RST GPIO pins, rotation and platform). All the
+    screens are fed from the same board and refreshed together; in headless
+    mode each gets a noop serial interface instead of an SPI port. """
+
+    def __init__(self, definitions, makeLayout, headless=False):
+        self.screens = []
+        for number, definition in enumerate(definitions, start=1):
+            device = makeDevice(definition, headless)
+            self.screens.append(Screen(number, definition, device, makeLayout(device)))
+        self.refresher = ScreenRefresher([screen.layout for screen in self.screens])
+
+    def __iter__(self):
+        return iter(self.screens)
+
+    def __len__(self):
+        return len(self.screens)
+
+    def refresh(self):
+        self.refresher.refresh()
+
+    def hide(self):
+        # display off through the controller, the panels stop drawing current
+        for screen in self.screens:
+            screen.device.hide()
+
+    def show(self):
+        for screen in self.screens:
+            screen.device.show()
+
+    def invalidate(self):
+        for screen in self.screens:
+            screen.layout.invalidate()
+
+    def frameStats(self):
+        """ (frames sent, frames skipped, pixels sent) summed over every screen
+        since the last call """
+        sent = skipped = pixels = 0
+        for screen in self.screens:
+            frames = screen.device.framebuffer
+            sent += frames.framesSent
+            skipped += frames.framesSkipped
+            pixels += frames.pixelsSent
+            frames.pixelsSent = frames.framesSent = frames.framesSkipped = 0
+        return sent, skipped, pixels
@@ -0,0 +1,413 @@
+"""
+A local stand-in for OpenLDBWS, answering GetDepBoardWithDetails,
+GetArrBoardWithDetails and GetNextDeparturesWithDetails so the fetch pipeline
+can be load and soak tested without the network or spending API quota.
+
+    python3 src/standin.py --services 10 --latency 0.3 --fault-rate 0.05
+    apiURL=http://127.0.0.1:8081/ apiKey=anything python3 src/main.py
+
+Boards are either synthesised around the current time (of any size, with
+--services and --calling-points), replayed in turn from saved responses
+(--replay benchmarks/fixtures) or fetched from the real service and saved as
+they go (--record DIR --upstream URL). Latency, soap:Faults and requests that
+never get an answer can be injected into any of them.
+"""
+import argparse
+import itertools
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+import requests
+
+# saved responses are found by the operation they answer, named like the
+# fixtures in benchmarks/fixtures: departures_small.xml, arrivals.xml ...
+PREFIXES = {
+    "GetDepBoardWithDetails": "departures",
+    "GetArrBoardWithDetails": "arrivals",
+    "GetNextDeparturesWithDetails": "next_departures"
+}
+
+ENVELOPE = (
+    '<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+    '<soap:Body>{}</soap:Body></soap:Envelope>'
+)
+# the namespaces and prefixes ldb11.asmx answers with
+RESPONSE = "http://thalesgroup.com/RTTI/2017-10-01/ldb/"
+TYPES = (
+    'xmlns:lt="http://thalesgroup.com/RTTI/2012-01-13/ldb/types"'
+    ' xmlns:lt6="http://thalesgroup.com/RTTI/2017-02-02/ldb/types"'
+    ' xmlns:lt7="http://thalesgroup.com/RTTI/2017-10-01/ldb/types"'
+    ' xmlns:lt4="http://thalesgroup.com/RTTI/2015-11-27/ldb/types"'
+    ' xmlns:lt5="http://thalesgroup.com/RTTI/2016-02-16/ldb/types"'
+)
+
+STATIONS = [
+    ("Slough", "SLO"), ("Maidenhead", "MAI"), ("Twyford", "TWY"), ("Reading", "RDG"), ("Tilehurst", "TLH"),
+    ("Pangbourne", "PAN"), ("Goring & Streatley", "GOR"), ("Cholsey", "CHO"), ("Didcot Parkway", "DID"),
+    ("Swindon", "SWI"), ("Chippenham", "CPM"), ("Bath Spa", "BTH"), ("Bristol Temple Meads", "BRI"),
+    ("Weston-super-Mare", "WSM"), ("Taunton", "TAU"), ("Exeter St Davids", "EXD"), ("Newton Abbot", "NTA"),
+    ("Totnes", "TOT"), ("Plymouth", "PLY"), ("Liskeard", "LSK"), ("Bodmin Parkway", "BOD"), ("Par", "PAR"),
+    ("St Austell", "SAU"), ("Truro", "TRU"), ("Redruth", "RED"), ("Camborne", "CBN"), ("St Erth", "SER"),
+    ("Penzance", "PNZ")
+]
+# where the portions of a splitting train go after they part at Swindon
+BRANCH = [
+    ("Bristol Parkway", "BPW"), ("Newport (S Wales)", "NWP"), ("Cardiff Central", "CDF"), ("Bridgend", "BGN"),
+    ("Port Talbot Parkway", "PTA"), ("Neath", "NTH"), ("Swansea", "SWA")
+]
+SPLIT_AT = "SWI"
+NAMES = dict([(crs, name) for name, crs in STATIONS + BRANCH] + [("PAD", "London Paddington")])
+
+
+def fault(message):
+    return ENVELOPE.format(
+        "<soap:Fault><faultcode>soap:Client</faultcode>"
+        f"<faultstring>{escape(message)}</faultstring><detail /></soap:Fault>")
+
+
+def readRequest(payload):
+    """ The operation (without the Request suffix) and fields of a SOAP request
+    as built by ldbws.buildRequest """
+    body = next(element for element in ET.fromstring(payload) if element.tag.endswith("Body"))
+    request = body[0]
+    operation = request.tag.split("}")[-1]
+    if operation.endswith("Request"):
+        operation = operation[:-len("Request")]
+    fields = {}
+    for field in request:
+        name = field.tag.split("}")[-1]
+        if len(field):
+            fields[name] = [item.text for item in field]
+        else:
+            fields[name] = field.text or ""
+    return operation, fields
+
+
+class SyntheticBoards:
+    """ Makes up boards around the current time: services every few minutes,
+    each calling at callingPoints stations, with a share of them late or
+    cancelled, busRate of them replacement buses and splitRate of the trains
+    dividing into two portions. services overrides the numRows asked for. """
+
+    def __init__(self, services=None, callingPoints=10, lateRate=0.2, cancelRate=0.05, busRate=0.0, splitRate=0.0,
+                 seed=None):
+        self.services = services
+        self.callingPoints = callingPoints
+        self.lateRate = lateRate
+        self.cancelRate = cancelRate
+        self.busRate = busRate
+        self.splitRate = splitRate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.serviceIDs = itertools.count(100000)
+
+    def respond(self, operation, fields, payload):
+        rows = self.services or int(fields.get("numRows") or 10)
+        offset = int(fields.get("timeOffset") or 0)
+        now = datetime.now()
+        start = now.hour * 60 + now.minute + offset
+        with self.lock:
+            if operation == "GetNextDeparturesWithDetails":
+                destinations = [crs.strip() for item in fields.get("filterList") or ["RDG"]
+                                for crs in (item or "").split(",") if crs.strip()]
+                return self.nextDepartures(fields.get("crs", "PAD"), destinations, start)
+            if operation in ("GetDepBoardWithDetails", "GetArrBoardWithDetails"):
+                return self.board(operation, fields.get("crs", "PAD"), rows, start,
+                                  arrivals=operation == "GetArrBoardWithDetails")
+        return None
+
+    def tag(self, name, value, prefix="lt4"):
+        return f"<{prefix}:{name}>{escape(str(value))}</{prefix}:{name}>"
+
+    def location(self, name, crs):
+        return "<lt4:location>" + self.tag("locationName", name) + self.tag("crs", crs) + "</lt4:location>"
+
+    def hhmm(self, minutes):
+        minutes %= 1440
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    def service(self, crs, minutes, stops, arrivals=False, bus=False, split=False):
+        roll = self.random.random()
+        late = -1 if roll < self.cancelRate else (self.random.randint(1, 15) if roll < self.lateRate else 0)
+        expected = self.callingExpected(minutes, late)
+        serviceType = "bus" if bus else "train"
+        portions = [stops]
+        crsList = [stopCrs for _, stopCrs in stops]
+        if split and SPLIT_AT in crsList[:-1]:
+            parted = crsList.index(SPLIT_AT) + 1
+            portions.append(stops[:parted] + BRANCH[:max(1, len(stops) - parted)])
+
+        xml = "<lt7:service>"
+        xml += self.tag("sta" if arrivals else "std", self.hhmm(minutes)) + self.tag("eta" if arrivals else "etd", expected)
+        xml += self.tag("platform", "BUS" if bus else self.random.randint(1, 14))
+        xml += self.tag("operator", "Great Western Railway") + self.tag("operatorCode", "GW")
+        if late < 0:
+            xml += self.tag("isCancelled", "true") + self.tag("cancelReason", f"This {serviceType} has been cancelled")
+        xml += self.tag("serviceType", serviceType)
+        if not bus:
+            xml += self.tag("length", self.random.choice([5, 8, 9, 10]))
+        xml += self.tag("serviceID", f"{next(self.serviceIDs)}{crs}__")
+
+        here = (NAMES.get(crs, crs), crs)
+        if arrivals:
+            xml += "<lt5:origin>" + self.location(*stops[-1]) + "</lt5:origin>"
+            xml += "<lt5:destination>" + self.location(*here) + "</lt5:destination>"
+            portions = [list(reversed(stops[:-1]))]
+            start = minutes - 4 * len(stops)
+        else:
+            xml += "<lt5:origin>" + self.location(*here) + "</lt5:origin>"
+            xml += ("<lt5:destination>" + "".join(self.location(*portion[-1]) for portion in portions)
+                    + "</lt5:destination>")
+            start = minutes
+
+        lists = ""
+        for portion in portions:
+            at = start
+            points = ""
+            for name, stopCrs in portion:
+                at += self.random.randint(3, 12)
+                points += ("<lt7:callingPoint>" + self.tag("locationName", name, "lt7") + self.tag("crs", stopCrs, "lt7")
+                           + self.tag("st", self.hhmm(at), "lt7")
+                           + self.tag("at" if arrivals else "et", self.callingExpected(at, 0 if arrivals else late), "lt7")
+                           + "</lt7:callingPoint>")
+            lists += (f'<lt7:callingPointList serviceType="{serviceType}" serviceChangeRequired="false"'
+                      f' assocIsCancelled="false">{points}</lt7:callingPointList>')
+        listName = "previousCallingPoints" if arrivals else "subsequentCallingPoints"
+        xml += f"<lt7:{listName}>{lists}</lt7:{listName}>"
+        return xml + "</lt7:service>"
+
+    def callingExpected(self, minutes, late):
+        if late < 0:
+            return "Cancelled"
+        return self.hhmm(minutes + late) if late else "On time"
+
+    def stops(self, destination=None):
+        count = max(1, self.callingPoints)
+        first = self.random.randint(0, max(0, len(STATIONS) - count))
+        stops = [STATIONS[(first + i) % len(STATIONS)] for i in range(count)]
+        if destination is not None:
+            stops[-1] = (NAMES.get(destination, destination), destination)
+        return stops
+
+    def header(self, crs):
+        return (self.tag("generatedAt", datetime.now().astimezone().isoformat())
+                + self.tag("locationName", NAMES.get(crs, crs)) + self.tag("crs", crs))
+
+    def board(self, operation, crs, rows, start, arrivals=False):
+        trains = buses = ""
+        for i in range(rows):
+            if self.random.random() < self.busRate:
+                buses += self.service(crs, start + 1 + 3 * i, self.stops(), arrivals, bus=True)
+            else:
+                # only departing trains are shown dividing, and only those that go where they part
+                split = not arrivals and self.random.random() < self.splitRate
+                trains += self.service(crs, start + 1 + 3 * i, self.stops(), arrivals, split=split)
+        result = (f'<GetStationBoardResult {TYPES}>' + self.header(crs) + self.tag("platformAvailable", "true")
+                  + (f"<lt7:trainServices>{trains}</lt7:trainServices>" if trains else "")
+                  + (f"<lt7:busServices>{buses}</lt7:busServices>" if buses else "")
+                  + "</GetStationBoardResult>")
+        return ENVELOPE.format(f'<{operation}Response xmlns="{RESPONSE}">{result}</{operation}Response>')
+
+    def nextDepartures(self, crs, destinations, start):
+        departures = "".join(
+            f'<lt7:destination crs="{escape(destination)}">'
+            + self.service(crs, start + 2 + 4 * i, self.stops(destination)) + "</lt7:destination>"
+            for i, destination in enumerate(destinations))
+        result = (f'<DeparturesBoard {TYPES}>' + self.header(crs)
+                  + f"<lt7:departures>{departures}</lt7:departures></DeparturesBoard>")
+        return ENVELOPE.format(
+            f'<GetNextDeparturesWithDetailsResponse xmlns="{RESPONSE}">{result}</GetNextDeparturesWithDetailsResponse>')
+
+
+class ReplayedBoards:
+    """ Answers each operation with the saved responses for it in turn """
+
+    def __init__(self, directory):
+        self.responses = {}
+        for operation, prefix in PREFIXES.items():
+            names = sorted(name for name in os.listdir(directory)
+                           if name.startswith(prefix) and name.endswith(".xml"))
+            responses = []
+            for name in names:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    responses.append(f.read())
+            if responses:
+                self.responses[operation] = itertools.cycle(responses)
+        self.lock = threading.Lock()
+
+    def respond(self, operation, fields, payload):
+        with self.lock:
+            responses = self.responses.get(operation)
+            return next(responses) if responses is not None else None
+
+
+class RecordedBoards:
+    """ Passes requests on to the real service and saves each response, ready
+    to be replayed """
+
+    def __init__(self, upstream, directory, timeout=15):
+        self.upstream = upstream
+        self.directory = directory
+        self.timeout = timeout
+        self.session = requests.Session()
+        os.makedirs(directory, exist_ok=True)
+
+    def respond(self, operation, fields, payload):
+        response = self.session.post(self.upstream, data=payload, timeout=self.timeout,
+                                     headers={"Content-Type": "text/xml"})
+        prefix = PREFIXES.get(operation, operation)
+        path = os.path.join(self.directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{time.monotonic_ns() % 1000000:06d}.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        return response.text
+
+
+class StandInServer:
+    """ Serves boards from source over HTTP, the way OpenLDBWS does: latency
+    seconds plus up to jitter more before each answer, a soap:Fault with HTTP
+    500 for faultRate of requests, and for timeoutRate of them no answer at
+    all until hang seconds have passed and the connection is dropped. """
+
+    def __init__(self, source, host="127.0.0.1", port=8081, latency=0.0, jitter=0.0,
+                 faultRate=0.0, timeoutRate=0.0, hang=60, quiet=False):
+        server = self
+
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.faultRate = faultRate
+        self.timeoutRate = timeoutRate
+        self.hang = hang
+        self.quiet = quiet
+        self.counts = {"requests": 0, "faults": 0, "timeouts": 0}
+        self.countsLock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                server.handle(self, self.rfile.read(length))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def count(self, name):
+        with self.countsLock:
+            self.counts[name] += 1
+
+    def reply(self, handler, status, body):
+        data = body.encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "text/xml; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def handle(self, handler, payload):
+        started = time.monotonic()
+        self.count("requests")
+        try:
+            operation, fields = readRequest(payload)
+        except (ET.ParseError, StopIteration, IndexError):
+            self.reply(handler, 500, fault("Unable to read the request"))
+            return
+
+        roll = random.random()
+        if roll < self.timeoutRate:
+            self.count("timeouts")
+            self.log(operation, "timeout", started)
+            time.sleep(self.hang)
+            handler.close_connection = True
+            return
+
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if roll < self.timeoutRate + self.faultRate:
+            self.count("faults")
+            self.reply(handler, 500, fault("Unexpected server error"))
+            self.log(operation, 500, started)
+            return
+
+        try:
+            body = self.source.respond(operation, fields, payload)
+        except requests.RequestException as err:
+            body = None
+            print(f"Error: upstream request failed: {err}")
+        if body is None:
+            self.count("faults")
+            self.reply(handler, 500, fault(f"No response available for {operation}"))
+            self.log(operation, 500, started)
+            return
+
+        self.reply(handler, 200, body)
+        self.log(operation, 200, started)
+
+    def log(self, operation, status, started):
+        if not self.quiet:
+            print(f"{operation} {status} {(time.monotonic() - started) * 1000:.0f}ms")
+
+    def serve(self):
+        self.server.serve_forever()
+
+    def start(self):
+        threading.Thread(target=self.serve, name="StandInServer", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--replay", metavar="DIR", help="answer with the saved responses in this directory")
+    parser.add_argument("--record", metavar="DIR", help="pass requests on to --upstream and save the responses here")
+    parser.add_argument("--upstream", default="https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb11.asmx")
+    parser.add_argument("--services", type=int, help="services on each synthesised board, instead of numRows")
+    parser.add_argument("--calling-points", type=int, default=10, help="calling points of each synthesised service")
+    parser.add_argument("--bus-rate", type=float, default=0.0, help="share of synthesised services run as buses")
+    parser.add_argument("--split-rate", type=float, default=0.0,
+                        help="share of synthesised trains that divide into two portions")
+    parser.add_argument("--seed", type=int, help="seed for synthesised boards, to get the same ones every run")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds more before each answer")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="share of requests answered with a soap:Fault")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests never answered")
+    parser.add_argument("--hang", type=float, default=60, help="seconds an unanswered request is held open")
+    parser.add_argument("--quiet", action="store_true", help="don't print each request")
+    args = parser.parse_args()
+
+    if args.replay:
+        source = ReplayedBoards(args.replay)
+    elif args.record:
+        source = RecordedBoards(args.upstream, args.record)
+    else:
+        source = SyntheticBoards(args.services, args.calling_points, busRate=args.bus_rate,
+                                 splitRate=args.split_rate, seed=args.seed)
+
+    server = StandInServer(source, args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           faultRate=args.fault_rate, timeoutRate=args.timeout_rate, hang=args.hang, quiet=args.quiet)
+    print(f"OpenLDBWS stand-in on http://{args.host}:{args.port}/")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        counts = server.counts
+        print(f"{counts['requests']} requests, {counts['faults']} faults, {counts['timeouts']} timeouts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import math
+import time
+
+from luma.core.virtual import hotspot
+
+from glyphatlas import getAtlas
+
+
+class Clock(hotspot):
+    """ HH:MM with smaller :SS, drawn from the glyph atlas sprites of the two
+    fonts. It only asks to be redrawn once the next second has started, so
+    it costs nothing in between and never misses a second. """
+
+    def __init__(self, width, height, largeFont, smallFont):
+        super().__init__(width, height)
+        self.large = getAtlas(largeFont)
+        self.small = getAtlas(smallFont)
+        self.large.addGlyphs("0123456789:")
+        self.small.addGlyphs("0123456789:")
+        self.secondsWidth = self.measure(self.small, ":00")
+        self.nextTick = 0
+
+    def measure(self, atlas, text):
+        pen = 0.0
+        width = 0
+        for c in text:
+            _, glyphWidth, _, advance, _ = atlas.glyphs[c]
+            width = max(width, int(pen) + glyphWidth)
+            pen += advance
+        return width
+
+    def drawSprites(self, draw, atlas, text, x, y):
+        pen = 0.0
+        for c in text:
+            _, glyphWidth, glyphHeight, advance, glyph = atlas.glyphs[c]
+            if glyphWidth and glyphHeight:
+                draw.bitmap((x + int(pen), y), glyph, fill="yellow")
+            pen += advance
+
+    def invalidate(self):
+        self.nextTick = 0
+
+    def should_redraw(self):
+        return time.time() >= self.nextTick
+
+    def update(self, draw):
+        now = time.time()
+        self.nextTick = math.floor(now) + 1
+        localTime = time.localtime(now)
+
+        hoursMinutes = time.strftime("%H:%M", localTime)
+        seconds = time.strftime(":%S", localTime)
+
+        w1 = self.measure(self.large, hoursMinutes)
+        x = (self.width - w1 - self.secondsWidth) // 2
+        self.drawSprites(draw, self.large, hoursMinutes, x, 0)
+        self.drawSprites(draw, self.small, seconds, x + w1, 5)
+
+
+class StationScroller(hotspot):
+    """ The calling points row: the text slides up into view, pauses, then
+    scrolls left until it has gone, and repeats. The strip is rendered once
+    and its position is worked out from a monotonic clock, so the speed is
+    the same whatever frame rate is achieved. """
+
+    def __init__(self, width, height, text, speed, pause):
+        super().__init__(width, height)
+        self.speed = speed
+        self.pause = pause
+        self.setText(text)
+
+    def setText(self, text):
+        """ Swap in a new (width, height, bitmap) and start the scroll again """
+        self.textWidth, self.textHeight, self.bitmap = text
+        self.riseTime = self.textHeight / self.speed
+        self.slideTime = (self.textWidth + 1) / self.speed
+        self.cycle = self.riseTime + self.pause + self.slideTime
+        self.started = time.monotonic()
+        self.drawnAt = None
+
+    def invalidate(self):
+        self.drawnAt = None
+
+    def position(self, now):
+        elapsed = (now - self.started) % self.cycle
+        if elapsed < self.riseTime:
+            # slide the bitmap up from the bottom of its viewport until it's fully in view
+            return (0, self.textHeight - int(elapsed * self.speed))
+        elapsed -= self.riseTime
+        if elapsed < self.pause:
+            return (0, 0)
+        # slide the bitmap left until it's fully out of view
+        return (-int((elapsed - self.pause) * self.speed), 0)
+
+    def should_redraw(self):
+        return self.position(time.monotonic()) != self.drawnAt
+
+    def update(self, draw):
+        self.drawnAt = self.position(time.monotonic())
+        draw.bitmap(self.drawnAt, self.bitmap, fill="yellow")
+
+
+class Slot(hotspot):
+    """ A fixed area of a screen whose content is rebound instead of the
+    hotspot being replaced. Content is identified by a key: binding the key
+    already shown costs nothing, anything else is drawn on the next refresh.
+    An unbound slot draws as blank. """
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.key = None
+        self.drawFn = None
+        self.dirty = True
+
+    def bind(self, key, drawFn):
+        if key == self.key:
+            return
+        self.key = key
+        self.drawFn = drawFn
+        self.dirty = True
+
+    def clear(self):
+        self.bind(None, None)
+
+    def invalidate(self):
+        self.dirty = True
+
+    def should_redraw(self):
+        return self.dirty
+
+    def update(self, draw):
+        self.dirty = False
+        if self.drawFn is not None:
+            self.drawFn(draw, self.width, self.height)